@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Any, Literal
+
+import f15
+import f15_ext
+import parrewrite
+import typetree
+from f15 import AMI, AMIS, GenericTypeRewriter, NamePath, register_rewrite
+
+MISC_DIR = Path(__file__).resolve().parent
+
+STARTUP_SNIPPET = """
+import sys, time
+t0 = time.perf_counter_ns()
+import f15_ext
+try:
+    pass
+{extra}
+except ImportError as e:
+    # the eager case imports the rule targets, which aren't project dependencies
+    print("skipped", e.name)
+    sys.exit()
+t1 = time.perf_counter_ns()
+heavy = [m for m in ("pycparser.c_ast", "construct") if m in sys.modules]
+print(t1 - t0, ",".join(heavy))
+"""
+
+STARTUP_CASES = {
+    "lazy": "",
+    "eager": "\n".join(
+        f"    f15_ext.{c}.resolve_all()"
+        for c in (
+            "TypeRewriter",
+            "MuhrivedTypeRewriter",
+            "DerivedTypeRewriter",
+            "DubDerTypeRewriter",
+        )
+    ),
+}
+
+
+def bench_startup(runs: int) -> None:
+    for case, extra in STARTUP_CASES.items():
+        times: list[int] = []
+        heavy = ""
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, "-c", STARTUP_SNIPPET.format(extra=extra)],
+                cwd=MISC_DIR,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()
+            if out[0] == "skipped":
+                break
+            times.append(int(out[0]))
+            heavy = out[1] if len(out) > 1 else ""
+        if not times:
+            print(f"startup {case:>5}: skipped, {out[1]} isn't installed")
+            continue
+        print(
+            f"startup {case:>5}: min {min(times) / 1e6:8.2f} ms "
+            f"median {statistics.median(times) / 1e6:8.2f} ms imported: [{heavy}]"
+        )
+
+
+class BenchTypeRewriter(GenericTypeRewriter):
+    @register_rewrite("typing", "Union")
+    def rewrite_typing_Union(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+        return a + b
+
+    def plain(self, a: int, b: int, /) -> int:
+        return a + b
+
+
+def _timeit(stmt: str, runs: int, namespace: dict[str, Any], number: int = 200_000) -> float:
+    timer = timeit.Timer(stmt, globals=namespace)
+    return min(timer.repeat(repeat=runs, number=number)) / number * 1e9
+
+
+def bench_methods(runs: int) -> None:
+    btr = BenchTypeRewriter()
+    namespace = {
+        "btr": btr,
+        "info": BenchTypeRewriter.rewrite_method_for(NamePath("typing", "Union")),
+    }
+    cases = {
+        "plain attr": "btr.plain",
+        "plain call": "btr.plain(1, 2)",
+        "annotated attr": "btr.rewrite_typing_Union",
+        "annotated call": "btr.rewrite_typing_Union(1, 2)",
+        "_call_annotated_method": "btr._call_annotated_method(info, 1, 2)",
+    }
+    for case, stmt in cases.items():
+        print(f"methods {case:>22}: {_timeit(stmt, runs, namespace):8.1f} ns")
+
+
+def bench_namepath(runs: int) -> None:
+    count = 200_000
+    ctors = {
+        "NamePath()": NamePath,
+        "NamePath.intern()": NamePath.intern,
+    }
+    for case, ctor in ctors.items():
+        # build the names from non-constant strings like a trace decoder would
+        mods = [f"typ{'ing'}" for _ in range(count)]
+        tracemalloc.start()
+        nps = [ctor(m, "Union") for m in mods]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del mods
+        table = {NamePath.intern("typing", "Union"): None}
+        ns = _timeit("for np in nps: table[np]", runs, {"nps": nps, "table": table}, number=1)
+        print(
+            f"namepath {case:>17}: {size / count:6.1f} B/name "
+            f"registry probe: {ns / count:6.1f} ns/name"
+        )
+        del nps
+
+
+def bench_dispatch(runs: int) -> None:
+    # silence the rule bodies, both paths still pay for their f-string formatting
+    f15.print = f15_ext.print = lambda *args, **kwargs: None  # type: ignore
+    nps = [
+        NamePath.intern("typing", "Union"),
+        NamePath.intern("pycparser.c_ast", "Union"),
+        NamePath.intern("construct", "Union"),
+    ]
+    for cls in (f15.TypeRewriter, f15.MuhrivedTypeRewriter, f15_ext.DubDerTypeRewriter):
+        tr = cls()
+        hits = [np for np in nps if np in cls.rewrite_dispatch()]
+        generic = GenericTypeRewriter.rewrite_type
+        compiled = cls.compile_dispatch()
+        for np in hits:
+            namespace = {"tr": tr, "np": np, "generic": generic, "compiled": compiled}
+            g = _timeit("generic(tr, np, 1, 2)", runs, namespace, number=20_000)
+            c = _timeit("compiled(tr, np, 1, 2)", runs, namespace, number=20_000)
+            print(
+                f"dispatch {cls.__name__:>20} {np.module:>15}.{np.qualname}: "
+                f"generic {g:8.1f} ns compiled {c:8.1f} ns"
+            )
+
+
+def _many_rules_cls(nrules: int) -> type[GenericTypeRewriter]:
+    def rule(self: Any, a: int, b: int, /, meta: AMI = AMIS) -> int:
+        return a + b
+
+    ns: dict[str, Any] = {
+        f"rule{i}": register_rewrite("bench_many_rules", f"T{i}")(
+            type(rule)(rule.__code__, rule.__globals__, f"rule{i}", rule.__defaults__)
+        )
+        for i in range(nrules)
+    }
+    return type(f"Many{nrules}TypeRewriter", (GenericTypeRewriter,), ns)
+
+
+def bench_dispatch_many(runs: int) -> None:
+    # trivial rule bodies so the dispatch itself dominates, first rule, last rule and a miss
+    for nrules in (3, 20, 150):
+        cls = _many_rules_cls(nrules)
+        tr = cls()
+        generic = GenericTypeRewriter.rewrite_type
+        compiled = cls.compile_dispatch()
+        cases = {
+            "first": NamePath.intern("bench_many_rules", "T0"),
+            "last": NamePath.intern("bench_many_rules", f"T{nrules - 1}"),
+            "miss": NamePath.intern("bench_many_rules", "miss"),
+        }
+        for case, np in cases.items():
+            namespace = {"tr": tr, "np": np, "generic": generic, "compiled": compiled}
+            if case == "miss":
+                g_stmt = "try:\n    generic(tr, np, 1, 2)\nexcept KeyError:\n    pass"
+                c_stmt = g_stmt.replace("generic", "compiled")
+            else:
+                g_stmt, c_stmt = "generic(tr, np, 1, 2)", "compiled(tr, np, 1, 2)"
+            g = _timeit(g_stmt, runs, namespace, number=20_000)
+            c = _timeit(c_stmt, runs, namespace, number=20_000)
+            print(f"dispatch {nrules:4} rules {case:>5}: generic {g:8.1f} ns compiled {c:8.1f} ns")
+
+
+def _tree_corpus(distinct: int, repeat: int) -> list[Any]:
+    base = [int, str, bytes, float, None]
+    anns: list[Any] = []
+    for i in range(distinct):
+        leaf = base[i % len(base)]
+        anns.append(dict[str, tuple[leaf, ...]] | list[Literal[i]] | None)
+    return anns * repeat
+
+
+def bench_tree(runs: int) -> None:
+    for repeat in (1, 10, 100):
+        corpus = _tree_corpus(200, repeat)
+        total = sum(typetree.TypeNode.from_annotation(ann).size for ann in corpus)
+        best = float("inf")
+        for _ in range(runs):
+            otr = typetree.OptionalTreeRewriter()
+            t0 = time.perf_counter_ns()
+            for ann in corpus:
+                otr.rewrite_tree(typetree.TypeNode.from_annotation(ann))
+            best = min(best, time.perf_counter_ns() - t0)
+        print(
+            f"tree x{repeat:<4} {len(corpus):6} annotations {total:7} nodes "
+            f"{otr.memo_size:4} distinct subtrees: {best / 1e6:8.2f} ms"
+        )
+
+
+def bench_corpus(runs: int) -> None:
+    # 64 modules with 200 annotations each, distinct across modules so no worker's memo can
+    # shortcut another's shard
+    corpus = [
+        (
+            f"mod{m}",
+            [dict[str, tuple[Literal[m * 1000 + i], ...]] | list[int] | None for i in range(200)],
+        )
+        for m in range(64)
+    ]
+    ncpu = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, ncpu} - {w for w in (2, 4) if w > ncpu})
+    base = 0.0
+    for nworkers in workers:
+        best = float("inf")
+        for _ in range(runs):
+            t0 = time.perf_counter_ns()
+            for _ in parrewrite.rewrite_corpus(
+                typetree.OptionalTreeRewriter, corpus, max_workers=nworkers
+            ):
+                pass
+            best = min(best, time.perf_counter_ns() - t0)
+        base = base or best
+        print(f"corpus {nworkers:3} workers: {best / 1e6:8.2f} ms speedup {base / best:5.2f}x")
+
+
+def bench_instrumentation(runs: int) -> None:
+    btr = BenchTypeRewriter()
+    namespace = {"btr": btr, "np": NamePath.intern("typing", "Union")}
+    for case in ("disabled", "enabled"):
+        if case == "enabled":
+            f15.enable_instrumentation()
+        ns = _timeit("btr.rewrite_type(np, 1, 2)", runs, namespace)
+        f15.disable_instrumentation()
+        print(f"instrumentation {case:>8}: {ns:8.1f} ns")
+
+
+def bench_miss(runs: int) -> None:
+    namespace = {
+        "cls": f15_ext.DubDerTypeRewriter,
+        "np": NamePath.intern("dataclasses", "dataclass"),
+        "obj": object(),
+    }
+    cases = {
+        "lookup_rewrite_method": "cls.lookup_rewrite_method(np)",
+        "lookup_rewrite_method_for_object": "cls.lookup_rewrite_method_for_object(obj)",
+        "rewrite_method_for": "try:\n    cls.rewrite_method_for(np)\nexcept KeyError:\n    pass",
+    }
+    for case, stmt in cases.items():
+        print(f"miss {case:>32}: {_timeit(stmt, runs, namespace):8.1f} ns")
+
+
+BENCHES = {
+    "startup": bench_startup,
+    "methods": bench_methods,
+    "namepath": bench_namepath,
+    "dispatch": bench_dispatch,
+    "dispatch_many": bench_dispatch_many,
+    "tree": bench_tree,
+    "corpus": bench_corpus,
+    "instrumentation": bench_instrumentation,
+    "miss": bench_miss,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="f15 rewriter benchmarks")
+    parser.add_argument("benches", nargs="*", metavar="BENCH", help=f"one of: {', '.join(BENCHES)}")
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    args = parser.parse_args()
+    if unknown := set(args.benches) - set(BENCHES):
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    args.benches = args.benches or list(BENCHES)
+    for name in args.benches:
+        BENCHES[name](args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager, nullcontext
+from typing import Any, Literal
+
+import f11
+import typetree
+from framecap import capture_caller
+from monitrace import HAVE_MONITORING, SamplingPolicy, trace_calls_monitoring
+from monkeytype.db.base import CallTraceStoreLogger
+from monkeytype.db.sqlite import SQLiteStore, create_call_trace_table
+from monkeytype.tracing import CallTrace, CallTraceLogger, trace_calls
+from tracewriter import BatchingTraceWriter
+
+
+class CountingLogger(CallTraceLogger):
+    def __init__(self) -> None:
+        self.count = 0
+
+    def log(self, trace: CallTrace) -> None:
+        self.count += 1
+
+
+def _calc_workload() -> None:
+    c = f11.Calc()
+    for i in range(2_000):
+        c.add(i, 2)
+        c.mul(i, 3)
+
+
+_TREE_CORPUS = [dict[str, tuple[int, ...]] | list[Literal[i]] | None for i in range(200)]
+
+
+def _tree_workload() -> None:
+    otr = typetree.OptionalTreeRewriter()
+    for ann in _TREE_CORPUS:
+        otr.rewrite_annotation(ann)
+
+
+# workload -> (function, module whose calls are traced)
+WORKLOADS: dict[str, tuple[Callable[[], None], str]] = {
+    "calc": (_calc_workload, "f11"),
+    "typetree": (_tree_workload, "typetree"),
+}
+
+
+@contextmanager
+def _setprofile_tracer(logger: CallTraceLogger, module: str) -> Generator[None, None, None]:
+    with trace_calls(logger, 0, code_filter=lambda code: code.co_filename.endswith(f"{module}.py")):
+        yield
+
+
+TRACERS: dict[str, Callable[[CallTraceLogger, str], Any]] = {
+    "untraced": lambda logger, module: nullcontext(),
+    "setprofile": _setprofile_tracer,
+    # everything disabled after the first call, the cost of having the tracer on at all
+    "monitoring (other module)": lambda logger, module: trace_calls_monitoring(
+        logger, 0, ["no_such_module"]
+    ),
+    "monitoring": lambda logger, module: trace_calls_monitoring(logger, 0, [module]),
+}
+
+
+def _time_traced(
+    workload: Callable[[], None],
+    make_tracer: Callable[[CallTraceLogger, str], Any],
+    module: str,
+    runs: int,
+) -> tuple[float, int]:
+    best = float("inf")
+    logger = CountingLogger()
+    for _ in range(runs):
+        logger = CountingLogger()
+        with make_tracer(logger, module):
+            t0 = time.perf_counter_ns()
+            workload()
+            best = min(best, time.perf_counter_ns() - t0)
+    return best, logger.count
+
+
+def bench_overhead(runs: int) -> None:
+    # Calc.permeth prints its caller's frame, keep the terminal out of the measurement
+    f11.print = lambda *args, **kwargs: None  # type: ignore
+    for name, (workload, module) in WORKLOADS.items():
+        base = 0.0
+        for tracer_name, make_tracer in TRACERS.items():
+            if tracer_name.startswith("monitoring") and not HAVE_MONITORING:
+                print(f"overhead {name:>8} {tracer_name:>26}: needs Python 3.12+")
+                continue
+            best, ntraces = _time_traced(workload, make_tracer, module, runs)
+            base = base or best
+            print(
+                f"overhead {name:>8} {tracer_name:>26}: {best / 1e6:8.2f} ms "
+                f"{best / base:6.2f}x {ntraces:6} traces"
+            )
+
+
+def _long_calc_workload() -> None:
+    # long enough for sampled code to back off and get parked
+    c = f11.Calc()
+    for i in range(50_000):
+        c.add(i, 2)
+        c.mul(i, 3)
+
+
+SAMPLING_TRACERS: dict[str, Callable[[CallTraceLogger, str], Any]] = {
+    "untraced": TRACERS["untraced"],
+    "monitoring": TRACERS["monitoring"],
+    "monitoring (sampled)": lambda logger, module: trace_calls_monitoring(
+        logger, 0, [module], sampling=SamplingPolicy(quiet_calls=100, max_interval=64)
+    ),
+}
+
+
+def bench_sampling(runs: int) -> None:
+    if not HAVE_MONITORING:
+        print("sampling: needs Python 3.12+")
+        return
+    f11.print = lambda *args, **kwargs: None  # type: ignore
+    base = 0.0
+    for tracer_name, make_tracer in SAMPLING_TRACERS.items():
+        best, ntraces = _time_traced(_long_calc_workload, make_tracer, "f11", runs)
+        base = base or best
+        print(
+            f"sampling {'calc':>8} {tracer_name:>26}: {best / 1e6:8.2f} ms "
+            f"{best / base:6.2f}x {ntraces:6} traces"
+        )
+
+
+def _rss_mib() -> float:
+    # current RSS where /proc has it, otherwise the peak (KiB on Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+_MEMORY_CALLS = 20_000
+_MEMORY_STEPS = 5
+
+
+def _record_capture() -> Any:
+    return capture_caller()
+
+
+def _frame_capture() -> Any:
+    return sys._getframe(1)
+
+
+def _memory_workload(capture: Callable[[], Any], log: list[Any]) -> Callable[[], None]:
+    def handler(i: int) -> None:
+        # stands in for a request's locals, alive for as long as anything holds the frame
+        payload = bytearray(1024)
+        payload[0] = i & 0xFF
+        log.append(capture())
+
+    def hook() -> None:
+        handler_ = handler
+        for i in range(_MEMORY_CALLS):
+            handler_(i)
+
+    return hook
+
+
+def bench_memory(runs: int) -> None:
+    # every call keeps its capture, like a trace log would. Frames pin each call's payload, records
+    # are interned so the log only grows by a pointer per call. Records run first so the frames'
+    # freed memory can't flatter them.
+    captures: dict[str, Callable[[], Any]] = {
+        "records": _record_capture,
+        "frames": _frame_capture,
+    }
+    tracing = "monitoring (sampled)" if HAVE_MONITORING else "untraced"
+    for name, capture in captures.items():
+        log: list[Any] = []
+        gc.collect()
+        start = _rss_mib()
+        rss = []
+        with SAMPLING_TRACERS[tracing](CountingLogger(), __name__):
+            for _ in range(_MEMORY_STEPS):
+                _memory_workload(capture, log)()
+                rss.append(_rss_mib() - start)
+        steps = " ".join(f"{r:7.1f}" for r in rss)
+        print(f"memory {name:>8} {tracing:>20}: +MiB per {_MEMORY_CALLS} calls: {steps}")
+        del log
+
+
+_WRITER_TRACES = 20_000
+
+
+class _PerCallStoreLogger(CallTraceLogger):
+    # what a store that writes through on every call costs the caller
+    def __init__(self, store: SQLiteStore) -> None:
+        self.store = store
+
+    def log(self, trace: CallTrace) -> None:
+        self.store.add([trace])
+
+
+def _writer_loggers(path: str) -> dict[str, Callable[[], CallTraceLogger]]:
+    def store() -> SQLiteStore:
+        conn = sqlite3.connect(path)
+        create_call_trace_table(conn)
+        return SQLiteStore(conn)
+
+    return {
+        "store per call": lambda: _PerCallStoreLogger(store()),
+        "store logger": lambda: CallTraceStoreLogger(store()),
+        "batching writer": lambda: BatchingTraceWriter(path),
+    }
+
+
+def bench_writer(runs: int) -> None:
+    # time spent in the logging (traced) thread: in log() calls and in the final flush()
+    traces = [
+        CallTrace(f11.Calc.add, {"self": f11.Calc, "a": int, "b": typ}, int)
+        for typ in (int, float, str, bytes)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, make_logger in _writer_loggers(f"{tmp}/traces.sqlite3").items():
+            best_log = best_flush = float("inf")
+            nlog = _WRITER_TRACES if name != "store per call" else _WRITER_TRACES // 20
+            for _ in range(runs):
+                logger = make_logger()
+                t0 = time.perf_counter_ns()
+                for i in range(nlog):
+                    logger.log(traces[i & 3])
+                t1 = time.perf_counter_ns()
+                logger.flush()
+                t2 = time.perf_counter_ns()
+                best_log = min(best_log, t1 - t0)
+                best_flush = min(best_flush, t2 - t1)
+                if isinstance(logger, BatchingTraceWriter):
+                    logger.close()
+            print(
+                f"writer {name:>16}: {best_log / nlog / 1e3:8.2f} us/log "
+                f"flush {best_flush / 1e6:8.2f} ms ({nlog} traces)"
+            )
+
+
+BENCHES = {
+    "overhead": bench_overhead,
+    "sampling": bench_sampling,
+    "memory": bench_memory,
+    "writer": bench_writer,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="call tracing benchmarks")
+    parser.add_argument("benches", nargs="*", metavar="BENCH", help=f"one of: {', '.join(BENCHES)}")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    args = parser.parse_args()
+    if unknown := set(args.benches) - set(BENCHES):
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    args.benches = args.benches or list(BENCHES)
+    print(f"Python {sys.version.split()[0]}")
+    for name in args.benches:
+        BENCHES[name](args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import sys
+from types import CodeType, FrameType
+from typing import Any
+
+from f15 import NamePath, _canonical_namepath
+
+# qualname of a module's top level code object
+MODULE_QUALNAME = "<module>"
+
+
+def _code_qualname(code: CodeType) -> str:
+    # co_qualname is 3.11+, older code objects only know their bare name
+    return getattr(code, "co_qualname", code.co_name)
+
+
+# Bounded code object -> NamePath cache for attributing frames and samples to names. The module
+# part comes from the frame's f_globals["__name__"] (the code object doesn't know its module) and
+# the rest from co_qualname, e.g. f18_ext.FE.FEI.fei.<locals>.FEIX.FEIY.foo. Keyed by id() with the
+# code object kept in the entry so the id can't be reused while cached (code objects compare by
+# value, so two identical functions in different modules would share a dict key). A code object
+# run against different globals (exec) keeps the module it was first seen with.
+class CodeNameResolver:
+    maxsize: int
+    _cache: dict[int, tuple[CodeType, NamePath]]
+    # co_filename -> module name, rebuilt when sys.modules changes size
+    _files: dict[str, str]
+    _files_nmods: int
+
+    def __init__(self, maxsize: int = 65536) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"CodeNameResolver maxsize must be positive, got: {maxsize}")
+        self.maxsize = maxsize
+        self._cache = {}
+        self._files = {}
+        self._files_nmods = -1
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._files.clear()
+        self._files_nmods = -1
+
+    def for_frame(self, frame: FrameType) -> NamePath:
+        code = frame.f_code
+        ent = self._cache.get(id(code), None)
+        if ent is not None and ent[0] is code:
+            return ent[1]
+        return self._add(code, frame.f_globals.get("__name__", None))
+
+    def for_code(self, code: CodeType, f_globals: dict[str, Any] | None = None) -> NamePath:
+        # without globals the module is looked up by the code's filename
+        ent = self._cache.get(id(code), None)
+        if ent is not None and ent[0] is code:
+            return ent[1]
+        module = f_globals.get("__name__", None) if f_globals is not None else None
+        return self._add(code, module)
+
+    def _add(self, code: CodeType, module: str | None) -> NamePath:
+        if module is None:
+            module = self._module_for_file(code.co_filename)
+        # not NamePath.intern(), that table is never pruned and this sees every code object run
+        np = _canonical_namepath(module, _code_qualname(code))
+        while len(self._cache) >= self.maxsize:
+            self._cache.pop(next(iter(self._cache)), None)
+        self._cache[id(code)] = (code, np)
+        return np
+
+    def _module_for_file(self, filename: str) -> str:
+        if len(sys.modules) != self._files_nmods:
+            self._files_nmods = len(sys.modules)
+            self._files = {
+                mod.__file__: name
+                for name, mod in list(sys.modules.items())
+                if getattr(mod, "__file__", None)
+            }
+        # not from an imported module (exec, -c, ...), keep the filename so it's still unique
+        return self._files.get(filename, filename)
+
+
+code_names = CodeNameResolver()
+
+
+def frame_namepath(frame: FrameType) -> NamePath:
+    return code_names.for_frame(frame)
+
+
+def code_namepath(code: CodeType, f_globals: dict[str, Any] | None = None) -> NamePath:
+    return code_names.for_code(code, f_globals)
+
+
+def format_namepath(np: NamePath) -> str:
+    # module level code is named after its module alone
+    if np.qualname == MODULE_QUALNAME:
+        return np.module
+    return f"{np.module}.{np.qualname}"
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 import itertools
-from collections.abc import Iterable, Iterator, MutableMapping
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping, MutableMapping
 from copy import copy
 from types import MappingProxyType
-from typing import TypeVar
+from typing import Any, TypeVar
 
 import rich.repr
+from hamt import HAMT
 
 _KT = TypeVar("_KT")
 _VT = TypeVar("_VT")
 
+_MISSING: Any = object()
+
+TraceHook = Callable[["DictStack[Any, Any]", str, tuple[Any, ...]], None]
+# undo log entry kinds
+_UNDO_SET, _UNDO_PUSH, _UNDO_POP = range(3)
+
+
+def print_trace(stack: DictStack[Any, Any], op: str, keys: tuple[Any, ...]) -> None:
+    print(f"DictStack.{op}() name: {stack.name} keys: {keys}")
+
 
 # https://github.com/jaraco/jaraco.collections
 # MIT licensed Copyright 2025 Jason R. Coombs
@@ -70,16 +81,97 @@ class DictStack(MutableMapping[_KT, _VT]):
     >>> del stack['c']
     >>> dict(stack)
     {'a': 1}
+
+    With indexed=True the stack keeps a count of the layers each key occurs
+    in, making len() O(1) and iteration a plain walk over the index. It also
+    remembers which layer each looked up key was found in, so reads that fall
+    through to the bottom of a deep stack are O(1) after the first, and
+    mapping is a cached snapshot that is only patched for the keys touched
+    since it was taken. Layers must then only be mutated through the stack.
+
+    >>> stack = DictStack([dict(a=1, c=2), dict(b=2, a=2)], indexed=True)
+    >>> len(stack)
+    3
+    >>> list(stack)
+    ['a', 'c', 'b']
+    >>> stack.pushdict(dict(d=1))
+    >>> len(stack)
+    4
+    >>> _ = stack.popdict(0)
+    >>> sorted(stack)
+    ['a', 'b', 'd']
+    >>> stack.mapping is stack.mapping
+    True
+    >>> snap = stack.mapping
+    >>> stack.pushdict(dict(a=5))
+    >>> dict(snap), dict(stack.mapping)
+    ({'a': 2, 'b': 2, 'd': 1}, {'a': 5, 'b': 2, 'd': 1})
+
+    Speculative changes can be rolled back to a checkpoint:
+
+    >>> outer = stack.checkpoint()
+    >>> stack['a'] = 6
+    >>> inner = stack.checkpoint()
+    >>> _ = stack.popdict()
+    >>> del stack['d']
+    >>> stack.rollback(inner)
+    >>> dict(stack)
+    {'a': 6, 'b': 2, 'd': 1}
+    >>> stack.commit(outer)
+    >>> stack.dicts
+    [{'b': 2, 'a': 2}, {'d': 1}, {'a': 6}]
+
+    Bulk writes and deletes go to the top layer in one step:
+
+    >>> stack.update_many(dict(e=1, f=2))
+    >>> stack.delete_many(['a', 'e'])
+    >>> stack.dicts
+    [{'b': 2, 'a': 2}, {'d': 1}, {'f': 2}]
     """
 
     _name: str | None
     _dicts: list[MutableMapping[_KT, _VT]]
+    # key -> number of layers containing it, only in indexed mode
+    _counts: dict[_KT, int] | None
+    # key -> index of the topmost layer containing it, filled by lookups, only in indexed mode
+    _owners: dict[_KT, int] | None
+    # bumped by every mutation made through the stack
+    _version: int
+    # last mapping snapshot, the version it was taken at and the keys touched since
+    _snapshot: MappingProxyType[_KT, _VT] | None
+    _snapshot_version: int
+    _dirty: set[_KT] | None
+    # undo log of the open checkpoints, and (token, undo log length) for each of them
+    _undo: list[tuple[int, Any, Any]] | None
+    _checkpoints: list[tuple[int, int]]
+    _next_token: int
+    # opt-in debug hook, called with (stack, operation, keys) before every mutation
+    _trace: TraceHook | None
 
     def __init__(
-        self, dicts: Iterable[MutableMapping[_KT, _VT]] | None = None, name: str | None = None
+        self,
+        dicts: Iterable[MutableMapping[_KT, _VT]] | None = None,
+        name: str | None = None,
+        indexed: bool = False,
+        trace: TraceHook | None = None,
     ) -> None:
         self._name = name
+        self._trace = trace
         self._dicts = list(dicts) if dicts is not None else []
+        self._counts = None
+        self._owners = None
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+        self._dirty = None
+        self._undo = None
+        self._checkpoints = []
+        self._next_token = 0
+        if indexed:
+            self._counts = {}
+            self._owners = {}
+            for scope in self._dicts:
+                self._count_keys(scope, 1)
 
     @property
     def name(self) -> str | None:
@@ -89,47 +181,458 @@ class DictStack(MutableMapping[_KT, _VT]):
     def dicts(self) -> list[MutableMapping[_KT, _VT]]:
         return self._dicts
 
+    @property
+    def trace(self) -> TraceHook | None:
+        return self._trace
+
+    @trace.setter
+    def trace(self, hook: TraceHook | None) -> None:
+        self._trace = hook
+
+    @property
+    def indexed(self) -> bool:
+        return self._counts is not None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
     @property
     def mapping(self) -> MappingProxyType[_KT, _VT]:
-        return MappingProxyType(dict(self))
+        if self._counts is None:
+            return MappingProxyType(dict(self))
+        snapshot, dirty = self._snapshot, self._dirty
+        if snapshot is not None and self._snapshot_version == self._version:
+            return snapshot
+        if snapshot is None or dirty is None or len(dirty) > len(snapshot):
+            merged = dict(self)
+        else:
+            # earlier snapshots were handed out so they stay frozen, patch a copy
+            merged = snapshot.copy()
+            counts = self._counts
+            for key in dirty:
+                if key in counts:
+                    merged[key] = self[key]
+                else:
+                    merged.pop(key, None)
+        self._snapshot = MappingProxyType(merged)
+        self._snapshot_version = self._version
+        self._dirty = set()
+        return self._snapshot
 
     def __iter__(self) -> Iterator[_KT]:
+        if self._counts is not None:
+            # same order as the scan unless a layer other than the top one was popped. A snapshot
+            # of the keys like the scan takes, so the stack can be written to while iterating.
+            return iter(tuple(self._counts))
         return iter(dict.fromkeys(itertools.chain.from_iterable(self._dicts)))
 
+    def _count_keys(self, keys: Collection[_KT], delta: int) -> None:
+        # keys must be unique (a layer, its keys() or a set)
+        counts = self._counts
+        assert counts is not None
+        if delta > 0:
+            if len(keys) == 1:
+                for key in keys:
+                    counts[key] = counts.get(key, 0) + 1
+                return
+            # bulk: only keys that are already counted need a Python level increment
+            shadowed = {key: counts[key] + 1 for key in counts.keys() & keys}
+            counts.update(dict.fromkeys(keys, 1))
+            counts.update(shadowed)
+        else:
+            for key in keys:
+                if counts[key] == 1:
+                    del counts[key]
+                else:
+                    counts[key] -= 1
+
+    def _touch(self, keys: Iterable[_KT]) -> None:
+        self._version += 1
+        if self._dirty is not None:
+            self._dirty.update(keys)
+
+    def _own_keys(self, keys: Collection[_KT], idx: int) -> None:
+        # keys now resolve to layer idx, only update the ones that were already looked up
+        owners = self._owners
+        assert owners is not None
+        if len(keys) > len(owners):
+            keys = owners.keys() & keys
+        for key in keys:
+            if key in owners:
+                owners[key] = idx
+
+    def _disown_keys(self, keys: Collection[_KT], idx: int) -> None:
+        owners = self._owners
+        assert owners is not None
+        if len(keys) > len(owners):
+            keys = owners.keys() & keys
+        for key in keys:
+            if owners.get(key, -1) == idx:
+                del owners[key]
+
     def __getitem__(self, key: _KT, /) -> _VT:
+        owners = self._owners
+        if owners is not None:
+            idx = owners.get(key, -1)
+            if idx >= 0:
+                return self._dicts[idx][key]
         if not self._dicts:
             raise IndexError("DictStack stack is empty")
-        for scope in reversed(self._dicts):
-            if key in scope:
-                return scope[key]
+        if owners is None:
+            for scope in reversed(self._dicts):
+                if key in scope:
+                    return scope[key]
+            raise KeyError(key)
+        assert self._counts is not None
+        if key in self._counts:
+            for idx in range(len(self._dicts) - 1, -1, -1):
+                scope = self._dicts[idx]
+                if key in scope:
+                    owners[key] = idx
+                    return scope[key]
         raise KeyError(key)
 
+    def _insert_layer(self, idx: int, scope: MutableMapping[_KT, _VT]) -> None:
+        self._dicts.insert(idx, scope)
+        if self._counts is not None:
+            self._count_keys(scope, 1)
+            if idx == len(self._dicts) - 1:
+                self._own_keys(scope, idx)
+            else:
+                # every layer above idx moved up by one
+                assert self._owners is not None
+                self._owners.clear()
+        self._touch(scope)
+
+    def _remove_layer(self, idx: int) -> MutableMapping[_KT, _VT]:
+        top = len(self._dicts) - 1
+        scope = self._dicts.pop(idx)
+        if self._counts is not None:
+            self._count_keys(scope, -1)
+            if idx == top:
+                self._disown_keys(scope, top)
+            else:
+                # every layer above idx moved down by one
+                assert self._owners is not None
+                self._owners.clear()
+        self._touch(scope)
+        return scope
+
+    def _set_top(self, key: _KT, item: _VT) -> None:
+        top = self._dicts[-1]
+        if self._counts is not None:
+            if key not in top:
+                self._count_keys((key,), 1)
+            self._own_keys((key,), len(self._dicts) - 1)
+        top[key] = item
+        self._touch((key,))
+
+    def _set_top_many(self, items: dict[_KT, _VT]) -> None:
+        top = self._dicts[-1]
+        if self._counts is not None:
+            new = items.keys() - top.keys()
+            if new:
+                self._count_keys(new, 1)
+            self._own_keys(items.keys(), len(self._dicts) - 1)
+        top.update(items)
+        self._touch(items)
+
+    def _del_top_many(self, keys: dict[_KT, None]) -> None:
+        top = self._dicts[-1]
+        for key in keys:
+            del top[key]
+        if self._counts is not None:
+            self._count_keys(keys.keys(), -1)
+            self._disown_keys(keys.keys(), len(self._dicts) - 1)
+        self._touch(keys)
+
+    def _del_top(self, key: _KT) -> None:
+        del self._dicts[-1][key]
+        if self._counts is not None:
+            self._count_keys((key,), -1)
+            self._disown_keys((key,), len(self._dicts) - 1)
+        self._touch((key,))
+
     def pushdict(self, pushed_dict: MutableMapping[_KT, _VT] | None = None) -> None:
-        return self._dicts.append(pushed_dict if pushed_dict is not None else {})
+        # pushed_dict becomes the new layer as is, no copy is made and the stack owns it from here
+        scope = pushed_dict if pushed_dict is not None else {}
+        if self._trace is not None:
+            self._trace(self, "pushdict", tuple(scope))
+        if self._undo is not None:
+            self._undo.append((_UNDO_PUSH, None, None))
+        self._insert_layer(len(self._dicts), scope)
 
     def popdict(self, index: int = -1) -> MutableMapping[_KT, _VT]:
         if not self._dicts:
             raise IndexError("DictStack stack is empty")
-        return self._dicts.pop(index)
+        idx = range(len(self._dicts))[index]
+        scope = self._remove_layer(idx)
+        if self._undo is not None:
+            self._undo.append((_UNDO_POP, idx, scope))
+        if self._trace is not None:
+            self._trace(self, "popdict", tuple(scope))
+        return scope
 
     def __len__(self) -> int:
+        if self._counts is not None:
+            return len(self._counts)
         return len(list(iter(self)))
 
     def __setitem__(self, key: _KT, item: _VT, /) -> None:
-        print(f"DictStack.__setitem__() name: {self._name} key: {key}")
         if not self._dicts:
             raise IndexError("DictStack stack is empty")
-        self._dicts[-1][key] = item
+        if self._trace is not None:
+            self._trace(self, "__setitem__", (key,))
+        if self._undo is not None:
+            self._undo.append((_UNDO_SET, key, self._dicts[-1].get(key, _MISSING)))
+        self._set_top(key, item)
 
     def __delitem__(self, key: _KT, /) -> None:
         if not self._dicts:
             raise IndexError("DictStack stack is empty")
-        del self._dicts[-1][key]
+        old = self._dicts[-1][key]
+        if self._trace is not None:
+            self._trace(self, "__delitem__", (key,))
+        self._del_top(key)
+        if self._undo is not None:
+            self._undo.append((_UNDO_SET, key, old))
+
+    def update_many(self, items: Mapping[_KT, _VT] | Iterable[tuple[_KT, _VT]], /) -> None:
+        """
+        Write many bindings to the top layer at once, with one bulk update
+        of the layer and the indices instead of a __setitem__ call per key.
+        """
+        if not self._dicts:
+            raise IndexError("DictStack stack is empty")
+        items = items if type(items) is dict else dict(items)
+        if not items:
+            return
+        if self._trace is not None:
+            self._trace(self, "update_many", tuple(items))
+        if self._undo is not None:
+            top = self._dicts[-1]
+            self._undo.extend([(_UNDO_SET, key, top.get(key, _MISSING)) for key in items])
+        self._set_top_many(items)
+
+    def delete_many(self, keys: Iterable[_KT], /) -> None:
+        """
+        Delete many keys from the top layer at once. Nothing is deleted if
+        any of them is missing.
+        """
+        if not self._dicts:
+            raise IndexError("DictStack stack is empty")
+        unique = dict.fromkeys(keys)
+        if not unique:
+            return
+        top = self._dicts[-1]
+        for key in unique:
+            if key not in top:
+                raise KeyError(key)
+        if self._trace is not None:
+            self._trace(self, "delete_many", tuple(unique))
+        if self._undo is not None:
+            self._undo.extend([(_UNDO_SET, key, top[key]) for key in unique])
+        self._del_top_many(unique)
+
+    def checkpoint(self) -> int:
+        """
+        Start a (possibly nested) transaction and return its token. Until the
+        matching commit() or rollback(), every push, pop, write and delete
+        made through the stack is recorded in an undo log, so both cost
+        O(changes since the checkpoint) however large the layers are.
+        Transactions end in LIFO order.
+        """
+        if self._undo is None:
+            self._undo = []
+        self._next_token += 1
+        self._checkpoints.append((self._next_token, len(self._undo)))
+        return self._next_token
+
+    def _end_checkpoint(self, token: int) -> int:
+        if not self._checkpoints or self._checkpoints[-1][0] != token:
+            raise ValueError(f"DictStack checkpoint {token} is not the innermost open one")
+        return self._checkpoints.pop()[1]
+
+    def commit(self, token: int) -> None:
+        self._end_checkpoint(token)
+        if not self._checkpoints:
+            # outermost transaction done, nothing left that could roll these changes back
+            self._undo = None
+
+    def rollback(self, token: int) -> None:
+        pos = self._end_checkpoint(token)
+        undo = self._undo
+        assert undo is not None
+        while len(undo) > pos:
+            op, a, b = undo.pop()
+            if op == _UNDO_SET:
+                if b is _MISSING:
+                    self._del_top(a)
+                else:
+                    self._set_top(a, b)
+            elif op == _UNDO_PUSH:
+                self._remove_layer(len(self._dicts) - 1)
+            else:
+                self._insert_layer(a, b)
+        if not self._checkpoints:
+            self._undo = None
 
     def __copy__(self) -> DictStack[_KT, _VT]:
-        return DictStack(copy(self._dicts))
+        dicts = copy(self._dicts)
+        if self._counts is not None:
+            # the index relies on layers only changing through this stack, the copy can't share
+            # them (any layer can become its top after a popdict())
+            dicts = [copy(d) for d in dicts]
+        return DictStack(dicts, indexed=self.indexed, trace=self._trace)
+
+    def __rich_repr__(self) -> rich.repr.Result:
+        yield "name", self._name
+        yield "id", id(self)
+        yield "keys", list(self.mapping.keys())
+
+
+class FrozenDictStack(Mapping[_KT, _VT]):
+    """
+    Persistent (immutable) counterpart of DictStack. pushdict(), set(),
+    delete() and popdict() return new stacks that share structure with the
+    old one, so a base scope can be handed to many threads which each
+    push their own layers without copying or locking.
+
+    Every version keeps its parent, its own top layer and the merged view
+    of all layers, both as HAMTs, so lookups, len() and updates are
+    O(log n) and popdict() is O(1).
+
+    >>> base = FrozenDictStack([dict(a=1, c=2)])
+    >>> s1 = base.pushdict(dict(b=2, a=2))
+    >>> s2 = s1.set('a', 3)
+    >>> base['a'], s1['a'], s2['a']
+    (1, 2, 3)
+    >>> s3 = s2.delete('a')
+    >>> s3['a']
+    1
+    >>> sorted(s3.items())
+    [('a', 1), ('b', 2), ('c', 2)]
+    >>> rest, top = s2.popdict()
+    >>> rest is base, dict(top) == dict(a=3, b=2)
+    (True, True)
+    >>> base.dicts == [dict(a=1, c=2)]
+    True
+    """
+
+    __slots__ = ("_depth", "_merged", "_name", "_parent", "_top")
+
+    _name: str | None
+    _parent: FrozenDictStack[_KT, _VT] | None
+    _top: HAMT[_KT, _VT]
+    _merged: HAMT[_KT, _VT]
+    _depth: int
+
+    def __init__(
+        self, dicts: Iterable[Mapping[_KT, _VT]] | None = None, name: str | None = None
+    ) -> None:
+        self._name = name
+        empty: HAMT[_KT, _VT] = HAMT()
+        # build the chain off a separate empty root so that self isn't its own ancestor
+        node = self._make(None, empty, empty, 0)
+        for scope in dicts if dicts is not None else ():
+            node = node.pushdict(scope)
+        self._parent, self._top, self._merged, self._depth = (
+            node._parent,
+            node._top,
+            node._merged,
+            node._depth,
+        )
+
+    def _make(
+        self,
+        parent: FrozenDictStack[_KT, _VT] | None,
+        top: HAMT[_KT, _VT],
+        merged: HAMT[_KT, _VT],
+        depth: int,
+    ) -> FrozenDictStack[_KT, _VT]:
+        new = object.__new__(type(self))
+        new._name = self._name
+        new._parent = parent
+        new._top = top
+        new._merged = merged
+        new._depth = depth
+        return new
+
+    @property
+    def name(self) -> str | None:
+        return self._name
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    @property
+    def dicts(self) -> list[HAMT[_KT, _VT]]:
+        layers: list[HAMT[_KT, _VT]] = []
+        node: FrozenDictStack[_KT, _VT] | None = self
+        while node is not None and node._depth:
+            layers.append(node._top)
+            node = node._parent
+        return layers[::-1]
+
+    @property
+    def mapping(self) -> HAMT[_KT, _VT]:
+        return self._merged
+
+    def __iter__(self) -> Iterator[_KT]:
+        return iter(self._merged)
+
+    def __len__(self) -> int:
+        return len(self._merged)
+
+    def __getitem__(self, key: _KT, /) -> _VT:
+        if not self._depth:
+            raise IndexError("FrozenDictStack stack is empty")
+        return self._merged[key]
+
+    def __contains__(self, key: object, /) -> bool:
+        return key in self._merged
+
+    def pushdict(self, pushed_dict: Mapping[_KT, _VT] | None = None) -> FrozenDictStack[_KT, _VT]:
+        top: HAMT[_KT, _VT] = HAMT()
+        merged = self._merged
+        if pushed_dict:
+            top = HAMT(pushed_dict)
+            merged = merged.update(top.iter_items())
+        return self._make(self, top, merged, self._depth + 1)
+
+    def popdict(self) -> tuple[FrozenDictStack[_KT, _VT], HAMT[_KT, _VT]]:
+        if not self._depth:
+            raise IndexError("FrozenDictStack stack is empty")
+        assert self._parent is not None
+        return self._parent, self._top
+
+    def set(self, key: _KT, item: _VT) -> FrozenDictStack[_KT, _VT]:
+        if not self._depth:
+            raise IndexError("FrozenDictStack stack is empty")
+        return self._make(
+            self._parent, self._top.set(key, item), self._merged.set(key, item), self._depth
+        )
+
+    def delete(self, key: _KT) -> FrozenDictStack[_KT, _VT]:
+        # like DictStack.__delitem__ only the top layer is affected, lower bindings reappear
+        if not self._depth:
+            raise IndexError("FrozenDictStack stack is empty")
+        assert self._parent is not None
+        top = self._top.delete(key)
+        below = self._parent._merged.get(key, _MISSING)
+        if below is _MISSING:
+            merged = self._merged.delete(key)
+        else:
+            merged = self._merged.set(key, below)
+        return self._make(self._parent, top, merged, self._depth)
+
+    def thaw(self) -> DictStack[_KT, _VT]:
+        return DictStack([dict(d.iter_items()) for d in self.dicts], name=self._name)
 
     def __rich_repr__(self) -> rich.repr.Result:
         yield "name", self._name
         yield "id", id(self)
-        yield "keys", list(dict(self).keys())
+        yield "depth", self._depth
+        yield "keys", list(self._merged)
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-import sys
-
+from framecap import capture_caller, type_ids
 from rich import print
 
 
@@ -18,10 +17,11 @@ class Calc:
         return a * b + mt
 
     def permeth(self) -> int:
-        f = sys._getframe(1)
-        print(f)
-        print(f.f_globals)
-        print(f.f_locals)
+        # a record of the caller rather than the frame itself, which would keep its locals alive
+        rec = capture_caller()
+        print(rec)
+        print(type_ids.resolve(rec.arg_types))
+        print(type_ids.resolve(rec.local_types))
         return 10
 
 
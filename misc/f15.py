@@ -2,7 +2,12 @@ from __future__ import annotations
 
 import functools
 import importlib
-from collections.abc import Callable, Iterable
+import itertools
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass, field
 from types import MappingProxyType, MethodType, ModuleType
 from typing import (
@@ -53,26 +58,71 @@ def pid(obj: Any) -> str:
     return f"{id(obj):#010x}"
 
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, order=True, slots=True)
 class NamePath:
     module: str
     qualname: str
+    _hash: int = field(init=False, repr=False, compare=False)
 
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "module", sys.intern(self.module))
+        object.__setattr__(self, "qualname", sys.intern(self.qualname))
+        object.__setattr__(self, "_hash", hash((self.module, self.qualname)))
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if other.__class__ is not NamePath:
+            return NotImplemented
+        # interned strings so these are pointer compares unless one side wasn't interned
+        return self.module == other.module and self.qualname == other.qualname  # type: ignore
+
+    def __reduce__(self) -> tuple[Callable[[str, str], NamePath], tuple[str, str]]:
+        return _canonical_namepath, (self.module, self.qualname)
+
+    @classmethod
+    def intern(cls, module: str, qualname: str) -> NamePath:
+        # canonical shared instance, registry dict probes with it hit the identity fast path.
+        # The table is never pruned, so this is for names that live as long as the registry (rule
+        # targets and owners), get_namepath() and unpickling only reuse an existing one.
+        key = (module, qualname)
+        np = _namepath_interned.get(key, None)
+        if np is None:
+            np = _namepath_interned.setdefault(key, cls(module, qualname))
+        return np
+
+
+_namepath_interned: dict[tuple[str, str], NamePath] = {}
 
-@dataclass(frozen=True, order=True)
+
+def _canonical_namepath(module: str, qualname: str) -> NamePath:
+    # the interned instance if there is one, without adding to the table
+    np = _namepath_interned.get((module, qualname), None)
+    return np if np is not None else NamePath(module, qualname)
+
+
+@dataclass(frozen=True, order=True, slots=True)
 class ResolvedNamePath:
     namepath: NamePath
     module: ModuleType
     value: Any
 
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, order=True, slots=True)
 class AnnotatedMethodInfo:
-    resolved: ResolvedNamePath
+    namepath: NamePath
     name: str
     self_namepath: NamePath
     method: MethodType
 
+    @property
+    def resolved(self) -> ResolvedNamePath:
+        # resolution is deferred by AnnotatedMethod, so go through it instead of caching here
+        return cast("AnnotatedMethod[Any, ..., Any]", self.method).resolved_namepath
+
     def __repr__(self) -> str:
         return f'<AnnotatedMethodInfo name="{self.name}" self_namepath={self.self_namepath}>'
 
@@ -107,34 +157,122 @@ def dotted_getattr(obj: Any, path: str) -> Any:
     return obj
 
 
-def resolve_namepath(np: NamePath) -> ResolvedNamePath:
+def _resolve_namepath(np: NamePath) -> ResolvedNamePath:
     mod = importlib.import_module(np.module)
     val = dotted_getattr(mod, np.qualname)
     return ResolvedNamePath(np, mod, val)
 
 
-def get_namepath(val: Any) -> NamePath:
+def _get_namepath(val: Any) -> NamePath:
     if not hasattr(val, "__module__"):
         raise ValueError(f"Can't get NamePath: __module__ missing from val: {val}")
     if not hasattr(val, "__qualname__"):
         raise ValueError(f"Can't get NamePath: __qualname__ missing from val: {val}")
-    return NamePath(val.__module__, val.__qualname__)
+    module, qualname = val.__module__, val.__qualname__
+    # e.g. a function exec'd without __name__ in its globals has __module__ None
+    if not isinstance(module, str):
+        raise ValueError(f"Can't get NamePath: __module__ isn't a str for val: {val}")
+    if not isinstance(qualname, str):
+        raise ValueError(f"Can't get NamePath: __qualname__ isn't a str for val: {val}")
+    # don't grow the intern table with every traced value, but hand back the canonical instance
+    # for names a rule already uses so registry probes still take the identity fast path
+    return _canonical_namepath(module, qualname)
+
+
+# Bounded NamePath <-> object cache behind resolve_namepath() and get_namepath().
+# An entry is only trusted while sys.modules still holds the same module object with the same
+# __spec__ as when it was made, so removing a module or importlib.reload()-ing it (which installs
+# a fresh __spec__) invalidates its entries on next use. The oldest entry is evicted when full.
+class NamePathCache:
+    maxsize: int
+    _fwd: dict[NamePath, tuple[ResolvedNamePath, Any]]
+    # keyed by id(), the entry holds val so the id can't be reused while cached
+    _rev: dict[int, tuple[Any, NamePath, ModuleType | None, Any]]
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"NamePathCache maxsize must be positive, got: {maxsize}")
+        self.maxsize = maxsize
+        self._fwd = {}
+        self._rev = {}
+
+    def __len__(self) -> int:
+        return len(self._fwd) + len(self._rev)
+
+    def clear(self) -> None:
+        self._fwd.clear()
+        self._rev.clear()
+
+    def _evict(self, d: dict[Any, Any]) -> None:
+        # another thread can insert (class creation resolves concurrently) or empty the dict
+        # between iter() and next(), leave it to the next insert to evict then
+        try:
+            while len(d) >= self.maxsize:
+                d.pop(next(iter(d)), None)
+        except (RuntimeError, StopIteration):
+            pass
+
+    def resolve(self, np: NamePath) -> ResolvedNamePath:
+        ent = self._fwd.get(np, None)
+        if ent is not None:
+            rnp, spec = ent
+            if sys.modules.get(np.module) is rnp.module and rnp.module.__spec__ is spec:
+                return rnp
+            self._fwd.pop(np, None)
+        rnp = _resolve_namepath(np)
+        self._evict(self._fwd)
+        self._fwd[np] = (rnp, rnp.module.__spec__)
+        return rnp
+
+    def namepath(self, val: Any) -> NamePath:
+        ent = self._rev.get(id(val), None)
+        if ent is not None and ent[0] is val:
+            _, np, mod, spec = ent
+            cur_mod = sys.modules.get(np.module)
+            if cur_mod is mod and getattr(cur_mod, "__spec__", None) is spec:
+                return np
+            self._rev.pop(id(val), None)
+        np = _get_namepath(val)
+        mod = sys.modules.get(np.module)
+        self._evict(self._rev)
+        self._rev[id(val)] = (val, np, mod, getattr(mod, "__spec__", None))
+        return np
+
+
+namepath_cache = NamePathCache()
+
+
+def resolve_namepath(np: NamePath) -> ResolvedNamePath:
+    return namepath_cache.resolve(np)
+
+
+def get_namepath(val: Any) -> NamePath:
+    return namepath_cache.namepath(val)
 
 
 @dataclass(frozen=True)
 class AnnotatedMethod(Generic[_T, _P, _R_co]):
     _func: Callable[Concatenate[_T, _P], _R_co]
     _namepath: NamePath
+    _lazy: bool = True
     _name: str = field(init=False)
-    _rnp: ResolvedNamePath = field(init=False)
+    _rnp: ResolvedNamePath | None = field(init=False)
     _fmeta: Callable[Concatenate[_T, _P], _R_co] = field(init=False)
     _self_np: NamePath = field(init=False)
+    _info: AnnotatedMethodInfo = field(init=False)
 
-    # FIXME: Need weakref?
+    # Binding is a single MethodType allocation over the partial pre-bound with meta in
+    # __set_name__. Bound methods aren't cached on the instance: an entry in its __dict__ would be
+    # copied along by copy.copy() (still bound to the original) and break pickling.
 
     def __post_init__(self) -> None:
-        object.__setattr__(self, "_rnp", resolve_namepath(self._namepath))
-        object.__setattr__(self, "_fmeta", cast(Callable[Concatenate[_T, _P], _R_co], None))
+        # Only import the target eagerly when asked to. A target whose module is already loaded
+        # costs nothing to resolve so do it now, otherwise wait for the first use.
+        rnp = None
+        if not self._lazy or self._namepath.module in sys.modules:
+            rnp = resolve_namepath(self._namepath)
+        object.__setattr__(self, "_rnp", rnp)
+        object.__setattr__(self, "_fmeta", cast("Callable[Concatenate[_T, _P], _R_co]", None))
 
     @overload
     def __get__(self, obj: None, cls: type[_T], /) -> Callable[Concatenate[_T, _P], _R_co]: ...
@@ -145,8 +283,8 @@ class AnnotatedMethod(Generic[_T, _P, _R_co]):
     ) -> Callable[Concatenate[_T, _P], _R_co] | Callable[_P, _R_co]:
         if obj is None:
             return self._fmeta
-        p = functools.partial(self._func.__get__(obj, cls), meta=self.as_ntuple())
-        return cast(Callable[_P, _R_co], p)
+        # string form, subscripting Callable here would build a new generic alias per access
+        return cast("Callable[_P, _R_co]", MethodType(self._fmeta, obj))
 
     def __func__(self) -> Callable[Concatenate[_T, _P], _R_co]:
         return self._func
@@ -165,18 +303,31 @@ class AnnotatedMethod(Generic[_T, _P, _R_co]):
             )
         object.__setattr__(self, "_name", name)
         object.__setattr__(
-            self, "_self_np", NamePath(new_cls.__module__, f"{new_cls.__qualname__}.{name}")
+            self, "_self_np", NamePath.intern(new_cls.__module__, f"{new_cls.__qualname__}.{name}")
         )
-        nt = self.as_ntuple()
-        if new_cls not in new_cls._namespaces:
-            new_cls._namespaces[new_cls] = []
-        new_cls._namespaces[new_cls].append(self.as_ntuple())
+        nt = AnnotatedMethodInfo(self._namepath, name, self._self_np, cast(MethodType, self))
+        object.__setattr__(self, "_info", nt)
+        with _registry_lock:
+            # copy-on-write like the other registry tables, readers iterating the published dict
+            # or one of its lists never see it change. Stored on the root class, it is shared.
+            old = GenericTypeRewriter._namespaces
+            namespaces: SetOnceDict[type, list[AnnotatedMethodInfo]] = SetOnceDict(old)
+            dict.__setitem__(namespaces, new_cls, [*old.get(new_cls, ()), nt])
+            GenericTypeRewriter._namespaces = namespaces
+            GenericTypeRewriter._namespaces_ro = MappingProxyType(namespaces)
         # Argument "meta" has incompatible type "AnnotatedMethodInfo"; expected "_P.kwargs"
         p = functools.partial(self._func, meta=nt)  # type: ignore
-        object.__setattr__(self, "_fmeta", cast(Callable[Concatenate[_T, _P], _R_co], p))
+        object.__setattr__(self, "_fmeta", cast("Callable[Concatenate[_T, _P], _R_co]", p))
+
+    def resolve(self) -> ResolvedNamePath:
+        rnp = self._rnp
+        if rnp is None:
+            rnp = resolve_namepath(self._namepath)
+            object.__setattr__(self, "_rnp", rnp)
+        return rnp
 
     def as_ntuple(self) -> AnnotatedMethodInfo:
-        return AnnotatedMethodInfo(self._rnp, self._name, self._self_np, cast(MethodType, self))
+        return self._info
 
     @property
     def name(self) -> str:
@@ -188,6 +339,16 @@ class AnnotatedMethod(Generic[_T, _P, _R_co]):
 
     @property
     def resolved_namepath(self) -> ResolvedNamePath:
+        return self.resolve()
+
+    @property
+    def is_resolved(self) -> bool:
+        return self._rnp is not None
+
+    def resolve_if_imported(self) -> ResolvedNamePath | None:
+        # resolve without triggering an import, only if something else already loaded the target
+        if self._rnp is None and self._namepath.module in sys.modules:
+            return self.resolve()
         return self._rnp
 
     @property
@@ -197,12 +358,139 @@ class AnnotatedMethod(Generic[_T, _P, _R_co]):
 
 class register_rewrite:
     tgt_namepath: NamePath
+    lazy: bool
 
-    def __init__(self, tgt_module: str, tgt_qualname: str) -> None:
-        self.tgt_namepath = NamePath(tgt_module, tgt_qualname)
+    def __init__(self, tgt_module: str, tgt_qualname: str, *, lazy: bool = True) -> None:
+        self.tgt_namepath = NamePath.intern(tgt_module, tgt_qualname)
+        self.lazy = lazy
 
     def __call__(self, func: _F) -> _F:
-        return cast(_F, AnnotatedMethod(func, self.tgt_namepath))
+        return cast(_F, AnnotatedMethod(func, self.tgt_namepath, self.lazy))
+
+
+# Per rule hit counters and latency histograms, per target miss counters. Installed process wide
+# with enable_instrumentation(), while disabled (the default) the dispatch paths pay only for a
+# global load and an `is None` test. Latency buckets are log2 of the rule's call time in ns,
+# bucket i counts calls taking [2**(i-1), 2**i) ns. Subclass and override record_hit() /
+# record_miss() for custom hooks. Counter updates aren't atomic, concurrent rewriters in
+# free-threaded builds may lose the odd increment.
+class RewriteInstrumentation:
+    NBUCKETS: ClassVar[int] = 64
+
+    hits: dict[NamePath, int]
+    total_ns: dict[NamePath, int]
+    latency: dict[NamePath, list[int]]
+    misses: dict[NamePath, int]
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.hits = {}
+        self.total_ns = {}
+        self.latency = {}
+        self.misses = {}
+
+    def record_hit(self, rule_np: NamePath, ns: int) -> None:
+        hist = self.latency.get(rule_np, None)
+        if hist is None:
+            hist = self.latency.setdefault(rule_np, [0] * self.NBUCKETS)
+            self.hits.setdefault(rule_np, 0)
+            self.total_ns.setdefault(rule_np, 0)
+        hist[min(ns.bit_length(), self.NBUCKETS - 1)] += 1
+        self.hits[rule_np] += 1
+        self.total_ns[rule_np] += ns
+
+    def record_miss(self, target_np: NamePath) -> None:
+        self.misses[target_np] = self.misses.get(target_np, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        # plain data copy, keyed by the rule's self_namepath (hits) or target NamePath (misses),
+        # histograms only list non-empty buckets as {upper bound ns: count}
+        return {
+            "hits": dict(self.hits),
+            "total_ns": dict(self.total_ns),
+            "latency_ns": {
+                np: {1 << i: n for i, n in enumerate(hist) if n}
+                for np, hist in self.latency.items()
+            },
+            "misses": dict(self.misses),
+        }
+
+    def top(self, n: int = 10) -> list[tuple[NamePath, int, int]]:
+        # (rule, hits, total ns) for the n rules with the most time spent
+        return sorted(
+            ((np, self.hits[np], ns) for np, ns in self.total_ns.items()),
+            key=lambda t: t[2],
+            reverse=True,
+        )[:n]
+
+
+_instrumentation: RewriteInstrumentation | None = None
+
+
+def enable_instrumentation(
+    instrumentation: RewriteInstrumentation | None = None,
+) -> RewriteInstrumentation:
+    global _instrumentation
+    if instrumentation is None:
+        instrumentation = RewriteInstrumentation()
+    _instrumentation = instrumentation
+    return instrumentation
+
+
+def disable_instrumentation() -> RewriteInstrumentation | None:
+    global _instrumentation
+    instrumentation, _instrumentation = _instrumentation, None
+    return instrumentation
+
+
+def get_instrumentation() -> RewriteInstrumentation | None:
+    return _instrumentation
+
+
+# Raised when no rule matches. Misses are the common case when rewriting traced types so the
+# message (which used to include the whole registry) is only formatted if somebody looks at it.
+class NoRewriteMethodError(KeyError):
+    def __init__(self, target: Any, by_object: bool = False) -> None:
+        super().__init__(target)
+        self.target = target
+        self.by_object = by_object
+
+    def __str__(self) -> str:
+        if self.by_object:
+            return f"No rewrite method for object: {self.target!r}"
+        return f"No rewrite method for NP: {self.target}"
+
+
+def _instrumented_rewrite_type(
+    instr: RewriteInstrumentation, rw: GenericTypeRewriter, namepath: NamePath, a: int, b: int
+) -> int:
+    rewriter = type(rw)._cls_rewrite_dispatch.get(namepath, None)
+    if rewriter is None:
+        instr.record_miss(namepath)
+        raise NoRewriteMethodError(namepath)
+    t0 = time.perf_counter_ns()
+    res = rw._call_annotated_method(rewriter, a, b)
+    instr.record_hit(rewriter.self_namepath, time.perf_counter_ns() - t0)
+    return cast(int, res)
+
+
+# rewrite_types() default, raise on a miss
+_RAISE: Any = object()
+
+
+# compiled dispatchers for tables up to this size test each rule's NamePath inline before the
+# table probe, see _compile_dispatch()
+_COMPILED_INLINE_RULES = 4
+
+
+# Serializes every write to the rewriter registry: _namespaces, _cls_rewrite_meths and the
+# derived dispatch tables. Readers never take it, tables are built off to the side and published
+# with a single class attribute store and are never mutated afterwards (copy-on-write), so a
+# lookup sees either the old or the new table. Reentrant as add_rewrite_method() calls
+# __set_name__().
+_registry_lock = threading.RLock()
 
 
 # TODO: change _cls_rewrite_meths value type to MethodInfo?
@@ -211,48 +499,323 @@ class GenericTypeRewriter:
     _namespaces_ro: ClassVar[MappingProxyType[type, list[AnnotatedMethodInfo]]] = MappingProxyType(
         _namespaces
     )
-    _cls_rewrite_meths: ClassVar[SetOnceDict[NamePath, AnnotatedMethodInfo]]
-    _cls_rewrite_meths_ro: ClassVar[MappingProxyType[NamePath, AnnotatedMethodInfo]]
+    _cls_rewrite_meths: ClassVar[SetOnceDict[NamePath, AnnotatedMethodInfo]] = SetOnceDict()
+    _cls_rewrite_meths_ro: ClassVar[MappingProxyType[NamePath, AnnotatedMethodInfo]] = (
+        MappingProxyType(_cls_rewrite_meths)
+    )
+    # MRO-flattened view of every _cls_rewrite_meths visible from the class, C3 precedence
+    _cls_rewrite_dispatch: ClassVar[dict[NamePath, AnnotatedMethodInfo]] = {}
+    _cls_rewrite_dispatch_ro: ClassVar[MappingProxyType[NamePath, AnnotatedMethodInfo]] = (
+        MappingProxyType(_cls_rewrite_dispatch)
+    )
+    # same rules keyed by id() of the resolved target so that every alias of an object hits
+    _cls_rewrite_dispatch_by_id: ClassVar[dict[int, AnnotatedMethodInfo]] = {}
+    # rules whose target module hasn't been imported yet and so are missing from the id index
+    _cls_rewrite_pending: ClassVar[tuple[AnnotatedMethodInfo, ...]] = ()
+    # len(sys.modules) when the pending rules were last checked, negative cache for object misses
+    _cls_pending_checked: ClassVar[int] = -1
+    # set by compile_dispatch(), inherited so subclasses of a compiled class are compiled too
+    _cls_compiled: ClassVar[bool] = False
 
     def __init_subclass__(cls) -> None:
-        cls._cls_rewrite_meths = SetOnceDict()
-        cls._cls_rewrite_meths_ro = MappingProxyType(cls._cls_rewrite_meths)
+        meths: SetOnceDict[NamePath, AnnotatedMethodInfo] = SetOnceDict()
         for val in vars(cls).values():
             if isinstance(val, AnnotatedMethod):
-                cls._cls_rewrite_meths[val.namepath] = val.as_ntuple()
+                meths[val.namepath] = val.as_ntuple()
+        with _registry_lock:
+            cls._cls_rewrite_meths = meths
+            cls._cls_rewrite_meths_ro = MappingProxyType(meths)
+            cls._build_dispatch()
+
+    @classmethod
+    def _build_dispatch(cls) -> None:
+        # must hold _registry_lock
+        dispatch: dict[NamePath, AnnotatedMethodInfo] = {}
+        # walk the MRO backwards so that earlier (more derived) classes win
+        for mcls in reversed(cls.__mro__):
+            if issubclass(mcls, GenericTypeRewriter):
+                dispatch.update(vars(mcls).get("_cls_rewrite_meths", {}))
+        cls._cls_rewrite_dispatch = dispatch
+        cls._cls_rewrite_dispatch_ro = MappingProxyType(dispatch)
+        cls._reset_identity_dispatch()
+        if cls._cls_compiled:
+            cls._compile_dispatch()
+
+    @classmethod
+    def _reset_identity_dispatch(cls) -> None:
+        # must hold _registry_lock
+        # the id index is built by the first object lookup, see _resolve_pending(), so creating a
+        # class doesn't pay for resolving rules that are never looked up by object
+        cls._cls_rewrite_dispatch_by_id = {}
+        cls._cls_rewrite_pending = tuple(cls._cls_rewrite_dispatch.values())
+        cls._cls_pending_checked = -1
+
+    @classmethod
+    def _build_identity_dispatch(cls) -> None:
+        # must hold _registry_lock
+        by_id: dict[int, AnnotatedMethodInfo] = {}
+        pending: list[AnnotatedMethodInfo] = []
+        # the merged table is in MRO precedence order already, shadowed rules aren't in it
+        for info in cls._cls_rewrite_dispatch.values():
+            try:
+                rnp = cast("AnnotatedMethod[Any, ..., Any]", info.method).resolve_if_imported()
+            except (ImportError, AttributeError):
+                # a target that doesn't exist can't be looked up by object, leave the rule out of
+                # the index for good instead of failing every unrelated object lookup. Dispatch by
+                # NamePath is unaffected, the error shows up if the rule resolves its target.
+                continue
+            if rnp is None:
+                pending.append(info)
+            else:
+                # the ResolvedNamePath keeps value alive so its id can't be reused
+                by_id[id(rnp.value)] = info
+        cls._cls_rewrite_dispatch_by_id = by_id
+        cls._cls_rewrite_pending = tuple(pending)
+        cls._cls_pending_checked = -1
+
+    @classmethod
+    def _resolve_pending(cls) -> bool:
+        # nothing can have become resolvable unless something was imported since the last check
+        nmods = len(sys.modules)
+        if nmods == cls._cls_pending_checked:
+            return False
+        cls._cls_pending_checked = nmods
+        for info in cls._cls_rewrite_pending:
+            if info.namepath.module in sys.modules:
+                with _registry_lock:
+                    cls._build_identity_dispatch()
+                return True
+        return False
+
+    @classmethod
+    def _rebuild_dispatch(cls) -> None:
+        todo: list[type[GenericTypeRewriter]] = [cls]
+        seen: set[type[GenericTypeRewriter]] = set()
+        with _registry_lock:
+            while todo:
+                mcls = todo.pop()
+                if mcls in seen:
+                    continue
+                seen.add(mcls)
+                mcls._build_dispatch()
+                todo.extend(mcls.__subclasses__())
+
+    @classmethod
+    def add_rewrite_method(cls, name: str, method: AnnotatedMethod[Any, ..., Any]) -> None:
+        if not isinstance(method, AnnotatedMethod):
+            raise TypeError(f"Can't add non-AnnotatedMethod rewrite method: {method}")
+        with _registry_lock:
+            # validate before touching anything, a rejected rule must leave the class as it was
+            existing = vars(cls)["_cls_rewrite_meths"].get(method.namepath, None)
+            if existing is not None:
+                raise ValueError(
+                    f"{cls.__qualname__} already has a rewrite method for {method.namepath}: "
+                    f"{existing}"
+                )
+            if hasattr(cls, name):
+                raise ValueError(f"{cls.__qualname__} already has an attribute named '{name}'")
+            setattr(cls, name, method)
+            method.__set_name__(cls, name)
+            meths = SetOnceDict(vars(cls)["_cls_rewrite_meths"])
+            meths[method.namepath] = method.as_ntuple()
+            cls._cls_rewrite_meths = meths
+            cls._cls_rewrite_meths_ro = MappingProxyType(meths)
+            cls._rebuild_dispatch()
 
     def _call_annotated_method(
         self, method_info: AnnotatedMethodInfo, /, *args: Any, **kwargs: Any
     ) -> Any:
-        # get a bound methhod from the function (yes the attribute is misnamed "method")
-        m = method_info.method.__get__(self, type(self))  # type: ignore
-        return m(*args, **kwargs)
+        # call the meta-bound function directly instead of creating a bound method first
+        # (yes the attribute is misnamed "method", it is the AnnotatedMethod)
+        return method_info.method._fmeta(self, *args, **kwargs)  # type: ignore
+
+    @classmethod
+    def resolve_all(cls) -> None:
+        # import every rule target up front, i.e. the pre-lazy behavior
+        for info in cls._cls_rewrite_dispatch.values():
+            cast("AnnotatedMethod[Any, ..., Any]", info.method).resolve()
 
     @classmethod
     def rewrite_methods(cls) -> MappingProxyType[NamePath, AnnotatedMethodInfo]:
         return cls._cls_rewrite_meths_ro
 
+    @classmethod
+    def rewrite_dispatch(cls) -> MappingProxyType[NamePath, AnnotatedMethodInfo]:
+        return cls._cls_rewrite_dispatch_ro
+
+    @classmethod
+    def lookup_rewrite_method(cls, namepath: NamePath) -> AnnotatedMethodInfo | None:
+        # sentinel returning variant of rewrite_method_for(), a miss is one dict probe
+        return cls._cls_rewrite_dispatch.get(namepath, None)
+
+    @classmethod
+    def lookup_rewrite_method_for_object(cls, obj: Any) -> AnnotatedMethodInfo | None:
+        rewriter = cls._cls_rewrite_dispatch_by_id.get(id(obj), None)
+        if rewriter is not None:
+            return rewriter
+        # obj is alive so its module is loaded, pick up any rule targeting it that is still lazy
+        if cls._cls_rewrite_pending and cls._resolve_pending():
+            return cls._cls_rewrite_dispatch_by_id.get(id(obj), None)
+        return None
+
     @classmethod
     def rewrite_method_for(cls, namepath: NamePath) -> AnnotatedMethodInfo:
-        for mcls in cls.mro():
-            if not issubclass(mcls, GenericTypeRewriter):
-                continue
-            rewriter = mcls.rewrite_methods().get(namepath, None)
-            if rewriter is not None:
-                return rewriter
-        raise KeyError(f"No rewrite method for NP: {namepath} methods: {cls.registry}")
+        rewriter = cls._cls_rewrite_dispatch.get(namepath, None)
+        if rewriter is not None:
+            return rewriter
+        raise NoRewriteMethodError(namepath)
+
+    @classmethod
+    def rewrite_method_for_object(cls, obj: Any) -> AnnotatedMethodInfo:
+        rewriter = cls.lookup_rewrite_method_for_object(obj)
+        if rewriter is not None:
+            return rewriter
+        raise NoRewriteMethodError(obj, by_object=True)
 
     @property
     def registry(self) -> MappingProxyType[type, list[AnnotatedMethodInfo]]:
         return self._namespaces_ro
 
     def rewrite_type(self, namepath: NamePath, a: int, b: int) -> int:
+        instr = _instrumentation
+        if instr is not None:
+            return _instrumented_rewrite_type(instr, self, namepath, a, b)
         rewriter = self.rewrite_method_for(namepath)
-        if rewriter is not None:
-            print(f"rewriter: NP: {rewriter.self_namepath} target type NP: {namepath}")
+        return cast(int, self._call_annotated_method(rewriter, a, b))
+
+    @classmethod
+    def compile_dispatch(cls) -> Callable[[Any, NamePath, int, int], int]:
+        # Opt-in: replace rewrite_type() on cls (and its subclasses) with generated code that has
+        # the rule table inlined, see _compile_dispatch(). Recompiled whenever the table changes.
+        with _registry_lock:
+            cls._cls_compiled = True
+            cls._rebuild_dispatch()
+        return cast(Callable[[Any, NamePath, int, int], int], cls.rewrite_type)
+
+    @classmethod
+    def _compile_dispatch(cls) -> None:
+        # the rewrite_type() the class actually gets, a hand-written override (its own or inherited)
+        # is left alone, only the generic one and generated ones are replaced
+        current = next(vars(m)["rewrite_type"] for m in cls.__mro__ if "rewrite_type" in vars(m))
+        if current is not vars(GenericTypeRewriter)["rewrite_type"] and not hasattr(
+            current, "__source__"
+        ):
+            return
+        # Rules are called through their function directly with meta pre-bound as a constant, no
+        # partial or bound method in between, found with a single probe of a constant table. Small
+        # tables also get one identity test per rule against its canonical (interned) target
+        # NamePath ahead of the probe. That doesn't scale: the tests run in sequence and every
+        # constant is a closure cell copied into each call's frame, so past a handful of rules
+        # the probe alone is faster.
+        table: dict[NamePath, tuple[Callable[..., Any], AnnotatedMethodInfo]] = {}
+        consts: dict[str, Any] = {"_table": table}
+        body: list[str] = []
+        inline = len(cls._cls_rewrite_dispatch) <= _COMPILED_INLINE_RULES
+        for i, (np, info) in enumerate(cls._cls_rewrite_dispatch.items()):
+            func = cast("AnnotatedMethod[Any, ..., Any]", info.method)._func
+            table[np] = (func, info)
+            if inline:
+                consts[f"_np{i}"], consts[f"_f{i}"], consts[f"_m{i}"] = np, func, info
+                body.extend((
+                    f"        if namepath is _np{i}:",
+                    f"            return _f{i}(self, a, b, meta=_m{i})",
+                ))
+        # same signature as GenericTypeRewriter.rewrite_type()
+        src = "\n".join([
+            f"def _make({', '.join(consts)}):",
+            "    def rewrite_type(self, namepath, a, b):",
+            "        instr = _instrumentation",
+            "        if instr is not None:",
+            "            return _instrumented_rewrite_type(instr, self, namepath, a, b)",
+            *body,
+            "        rewriter = _table.get(namepath, None)",
+            "        if rewriter is None:",
+            "            raise NoRewriteMethodError(namepath)",
+            "        return rewriter[0](self, a, b, meta=rewriter[1])",
+            "    return rewrite_type",
+        ])
+        # run against this module's globals so the generated code sees _instrumentation live
+        filename = f"<compiled dispatch {cls.__module__}.{cls.__qualname__}>"
+        ns: dict[str, Any] = {}
+        exec(compile(src, filename, "exec"), globals(), ns)
+        rewrite_type = ns["_make"](**consts)
+        rewrite_type.__qualname__ = f"{cls.__qualname__}.rewrite_type"
+        rewrite_type.__module__ = cls.__module__
+        rewrite_type.__source__ = src
+        cls.rewrite_type = rewrite_type  # type: ignore
+
+    def rewrite_types(
+        self,
+        items: Iterable[tuple[NamePath, tuple[Any, ...]]],
+        /,
+        counts: Counter[NamePath] | None = None,
+        chunk_size: int = 1024,
+        default: Any = _RAISE,
+        misses: Counter[NamePath] | None = None,
+    ) -> Iterator[Any]:
+        # Streaming batch version of rewrite_type(). Items are consumed chunk_size at a time and
+        # grouped by target so each rule is looked up and bound once per group, results come back
+        # in input order. counts, if given, is bumped per rule (keyed by its self_namepath) and
+        # misses per item without a rule (keyed by target). Without a default the first miss
+        # raises NoRewriteMethodError once the results before it have been yielded (items after it
+        # are neither run nor counted), with one a miss yields default in its place and the stream
+        # carries on.
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got: {chunk_size}")
+        it = iter(items)
+        while chunk := list(itertools.islice(it, chunk_size)):
+            groups: dict[NamePath, list[int]] = {}
+            for i, (namepath, _) in enumerate(chunk):
+                groups.setdefault(namepath, []).append(i)
+            results: list[Any] = [default] * len(chunk)
+            rewriters = [(np, idxs, self.lookup_rewrite_method(np)) for np, idxs in groups.items()]
+            # without a default nothing from the first miss on is yielded, so don't run it either
+            limit = len(chunk)
+            first_miss: NamePath | None = None
+            if default is _RAISE:
+                for namepath, idxs, rewriter in rewriters:
+                    if rewriter is None and idxs[0] < limit:
+                        limit, first_miss = idxs[0], namepath
+            instr = _instrumentation
+            for namepath, idxs, rewriter in rewriters:
+                if idxs[0] > limit:
+                    continue
+                if rewriter is None:
+                    # only the first miss itself is counted when it raises
+                    nmiss = len(idxs) if first_miss is None else 1
+                    if instr is not None:
+                        for _ in range(nmiss):
+                            instr.record_miss(namepath)
+                    if misses is not None:
+                        misses[namepath] += nmiss
+                    continue
+                if idxs[-1] >= limit:
+                    idxs = [i for i in idxs if i < limit]
+                m = rewriter.method.__get__(self, type(self))  # type: ignore
+                if instr is None:
+                    for i in idxs:
+                        results[i] = m(*chunk[i][1])
+                else:
+                    for i in idxs:
+                        t0 = time.perf_counter_ns()
+                        results[i] = m(*chunk[i][1])
+                        instr.record_hit(rewriter.self_namepath, time.perf_counter_ns() - t0)
+                if counts is not None:
+                    counts[rewriter.self_namepath] += len(idxs)
+            if first_miss is not None:
+                yield from results[:limit]
+                raise NoRewriteMethodError(first_miss)
+            yield from results
+
+    def rewrite_object(self, obj: Any, a: int, b: int) -> int:
+        rewriter = self.rewrite_method_for_object(obj)
+        instr = _instrumentation
+        if instr is None:
             return cast(int, self._call_annotated_method(rewriter, a, b))
-        else:
-            raise KeyError(f"couldn't get key for namepath: {namepath}")
+        t0 = time.perf_counter_ns()
+        res = self._call_annotated_method(rewriter, a, b)
+        instr.record_hit(rewriter.self_namepath, time.perf_counter_ns() - t0)
+        return cast(int, res)
 
 
 class TypeRewriter(GenericTypeRewriter):
@@ -11,6 +11,7 @@ from f15 import (
     MuhrivedTypeRewriter,
     NamePath,
     TypeRewriter,
+    enable_instrumentation,
     register_rewrite,
 )
 
@@ -59,6 +60,7 @@ if __name__ == "__main__":
     print(f"np_c: {np_c}")
     print(f"np_s: {np_s}")
     # sys.exit()
+    instr = enable_instrumentation()
 
     print("\n" * 2)
 
@@ -92,3 +94,6 @@ if __name__ == "__main__":
     print()
     print(f"rw_ddty construct.Union: 10, 20: {ddtr.rewrite_type(np_s, 600_000, 600_000)}")
     print()
+
+    print("\n" * 2)
+    print(instr.snapshot())
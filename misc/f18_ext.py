@@ -3,8 +3,11 @@ from __future__ import annotations
 import sys as sys
 import traceback
 import types
-from typing import Any, cast
+from typing import Any
 
+from codenames import format_namepath
+from f15 import NamePath
+from framecap import capture_frame, capture_stack
 from rich import print
 
 print("f18_ext mod top level")
@@ -68,12 +71,13 @@ class FE:
                     def foo(self):
                         def bar(arg):
                             traceback.print_stack()
-                            return ("flag", sys._getframe(), arg)
+                            # the stack's names, not the frame, so nothing here pins its locals
+                            return ("flag", capture_stack(sys._getframe()), arg)
 
                         def bar_wrapper():
-                            return bar((sys._getframe(), bar_wrapper, bar))
+                            return bar((capture_frame(sys._getframe()), bar_wrapper, bar))
 
-                        return [bar_wrapper, bar_wrapper(), sys._getframe(), None]
+                        return [bar_wrapper, bar_wrapper(), capture_frame(sys._getframe()), None]
 
                     @staticmethod
                     def what():
@@ -99,29 +103,14 @@ print(f18_ext_mod_top_frame)
 f18_ext_frame_thingy(f18_ext_mod_top_frame)
 
 
-def walk_frames(frame: types.FrameType | None) -> None:
-    depth = 0
-
-    class F:
-        f_back = frame
-
-    frame = cast(types.FrameType, F())
-    depth = 0
-    while frame := frame.f_back:
-        print(f"[{depth}] name: {frame.f_code.co_name}")
-        depth += 1
+def walk_frames(stack: tuple[NamePath, ...]) -> None:
+    for depth, np in enumerate(stack):
+        print(f"[{depth}] name: {format_namepath(np)}")
 
 
 walk_frames(FE.stuff_clsvar[1][1])
-# Current:
-# [0] name: bar
-# [1] name: bar_wrapper
-# [2] name: foo
-# [3] name: FE
-# [4] name: <module>
-# Desired:
-# [0] name: bar
-# [1] name: bar_wrapper
-# [2] name: foo
-# [3] name: FE
-# [4] name: misc.f18_ext
+# [0] name: f18_ext.FE.FEI.fei.<locals>.FEIX.FEIY.foo.<locals>.bar
+# [1] name: f18_ext.FE.FEI.fei.<locals>.FEIX.FEIY.foo.<locals>.bar_wrapper
+# [2] name: f18_ext.FE.FEI.fei.<locals>.FEIX.FEIY.foo
+# [3] name: f18_ext.FE
+# [4] name: f18_ext
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import inspect
+import sys
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any
+
+from codenames import CodeNameResolver, code_names
+from f15 import NamePath
+
+# Holding on to a frame (sys._getframe() results, tracebacks, tracer bookkeeping) keeps every local
+# in it and every frame up its f_back chain alive. Captures here reduce a frame to a FrameRecord
+# on the spot: the names of its code and of its caller's code plus interned type ids for its
+# arguments and locals, nothing that refers back to a frame or to the values themselves.
+
+
+# Type <-> small int interning. Ids are handed out in first seen order and never reused, so a
+# record's ids stay valid for the life of the interner.
+class TypeInterner:
+    _ids: dict[Any, int]
+    _types: list[Any]
+
+    def __init__(self) -> None:
+        self._ids = {}
+        self._types = []
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def id_for(self, typ: Any) -> int:
+        tid = self._ids.get(typ, None)
+        if tid is None:
+            tid = self._ids[typ] = len(self._types)
+            self._types.append(typ)
+        return tid
+
+    def type_for(self, tid: int) -> Any:
+        return self._types[tid]
+
+    def resolve(self, type_ids: Iterable[tuple[str, int]]) -> dict[str, Any]:
+        return {name: self._types[tid] for name, tid in type_ids}
+
+
+type_ids = TypeInterner()
+
+
+@dataclass(frozen=True, slots=True)
+class FrameRecord:
+    code: NamePath
+    # None for a frame with no caller (the bottom of the stack)
+    caller: NamePath | None
+    # (name, type id) in co_varnames order, *args/**kwargs included
+    arg_types: tuple[tuple[str, int], ...]
+    # every other local visible in f_locals, cell and free variables included
+    local_types: tuple[tuple[str, int], ...]
+
+
+def _nargs(flags: int, argcount: int, kwonlyargcount: int) -> int:
+    return (
+        argcount
+        + kwonlyargcount
+        + bool(flags & inspect.CO_VARARGS)
+        + bool(flags & inspect.CO_VARKEYWORDS)
+    )
+
+
+# Frame -> FrameRecord capture. Equal records are interned (up to maxsize of them) so a hot call
+# site that keeps seeing the same types hands out one shared record instead of a new one per call.
+class FrameCapture:
+    types: TypeInterner
+    names: CodeNameResolver
+    type_of: Callable[[Any], Any]
+    maxsize: int
+    _records: dict[FrameRecord, FrameRecord]
+
+    def __init__(
+        self,
+        types: TypeInterner | None = None,
+        names: CodeNameResolver | None = None,
+        type_of: Callable[[Any], Any] = type,
+        maxsize: int = 65536,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"FrameCapture maxsize must be positive, got: {maxsize}")
+        self.types = types if types is not None else type_ids
+        self.names = names if names is not None else code_names
+        self.type_of = type_of
+        self.maxsize = maxsize
+        self._records = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def clear(self) -> None:
+        self._records.clear()
+
+    def capture(self, frame: FrameType) -> FrameRecord:
+        code = frame.f_code
+        back = frame.f_back
+        nargs = _nargs(code.co_flags, code.co_argcount, code.co_kwonlyargcount)
+        arg_names = code.co_varnames[:nargs]
+        id_for = self.types.id_for
+        type_of = self.type_of
+        f_locals = frame.f_locals
+        rec = FrameRecord(
+            self.names.for_frame(frame),
+            self.names.for_frame(back) if back is not None else None,
+            tuple(
+                (name, id_for(type_of(f_locals[name]))) for name in arg_names if name in f_locals
+            ),
+            tuple(
+                (name, id_for(type_of(value)))
+                for name, value in f_locals.items()
+                if name not in arg_names
+            ),
+        )
+        interned = self._records.get(rec, None)
+        if interned is not None:
+            return interned
+        while len(self._records) >= self.maxsize:
+            self._records.pop(next(iter(self._records)), None)
+        self._records[rec] = rec
+        return rec
+
+    def capture_caller(self, depth: int = 1) -> FrameRecord:
+        # depth 1 is the frame that called the function calling capture_caller()
+        frame = sys._getframe(depth + 1)
+        try:
+            return self.capture(frame)
+        finally:
+            del frame
+
+
+frame_capture = FrameCapture()
+
+
+def capture_frame(frame: FrameType) -> FrameRecord:
+    return frame_capture.capture(frame)
+
+
+def capture_caller(depth: int = 1) -> FrameRecord:
+    return frame_capture.capture_caller(depth + 1)
+
+
+def capture_stack(frame: FrameType | None) -> tuple[NamePath, ...]:
+    # names of frame and everything up its f_back chain, innermost first
+    names = []
+    while frame is not None:
+        names.append(code_names.for_frame(frame))
+        frame = frame.f_back
+    return tuple(names)
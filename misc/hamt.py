@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar, Union
+
+_KT = TypeVar("_KT")
+_VT = TypeVar("_VT")
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+
+_MISSING: Any = object()
+
+
+# Persistent hash array mapped trie. Every update path-copies the O(log32 n) nodes between the
+# root and the changed entry and shares everything else with the previous version, so old
+# versions stay valid and can be read from any thread without locking.
+#
+# Interior nodes are a 32 bit bitmap plus a dense tuple with one slot per set bit. A slot holds
+# either a leaf (hash, key, value) tuple or a child node. Keys whose full 64 bit hashes are equal
+# end up in a _CollisionNode.
+@dataclass(slots=True, eq=False)
+class _BitmapNode:
+    bitmap: int
+    slots: tuple[Any, ...]
+
+
+@dataclass(slots=True, eq=False)
+class _CollisionNode:
+    hash: int
+    leaves: tuple[tuple[int, Any, Any], ...]
+
+
+_Node = Union[_BitmapNode, _CollisionNode]
+_EMPTY_NODE = _BitmapNode(0, ())
+
+
+def _hash(key: Any) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _merge(e1: Any, h1: int, e2: Any, h2: int, shift: int) -> _Node:
+    # e1/e2 are leaves or collision nodes that landed in the same slot at shift - _BITS
+    if h1 == h2:
+        # only leaves can have equal hashes here, a collision node already absorbed the key
+        return _CollisionNode(h1, (e1, e2))
+    i1 = (h1 >> shift) & _MASK
+    i2 = (h2 >> shift) & _MASK
+    if i1 == i2:
+        return _BitmapNode(1 << i1, (_merge(e1, h1, e2, h2, shift + _BITS),))
+    slots = (e1, e2) if i1 < i2 else (e2, e1)
+    return _BitmapNode((1 << i1) | (1 << i2), slots)
+
+
+def _get(node: _Node, h: int, key: Any, default: Any) -> Any:
+    shift = 0
+    while True:
+        if type(node) is _CollisionNode:
+            for _, k, v in node.leaves:
+                if k is key or k == key:
+                    return v
+            return default
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return default
+        entry = node.slots[(node.bitmap & (bit - 1)).bit_count()]
+        if type(entry) is tuple:
+            if entry[1] is key or entry[1] == key:
+                return entry[2]
+            return default
+        node = entry
+        shift += _BITS
+
+
+def _set(node: _Node, h: int, key: Any, value: Any, shift: int) -> tuple[_Node, bool]:
+    # returns the new node and whether key was added (rather than replaced)
+    if type(node) is _CollisionNode:
+        if h != node.hash:
+            return _merge(node, node.hash, (h, key, value), h, shift), True
+        leaves = node.leaves
+        for i, (_, k, v) in enumerate(leaves):
+            if k is key or k == key:
+                if v is value:
+                    return node, False
+                return _CollisionNode(h, (*leaves[:i], (h, key, value), *leaves[i + 1 :])), False
+        return _CollisionNode(h, (*leaves, (h, key, value))), True
+    bit = 1 << ((h >> shift) & _MASK)
+    idx = (node.bitmap & (bit - 1)).bit_count()
+    slots = node.slots
+    if not node.bitmap & bit:
+        return _BitmapNode(node.bitmap | bit, (*slots[:idx], (h, key, value), *slots[idx:])), True
+    entry = slots[idx]
+    if type(entry) is tuple:
+        if entry[1] is key or entry[1] == key:
+            if entry[2] is value:
+                return node, False
+            new: Any = (h, key, value)
+            added = False
+        else:
+            new = _merge(entry, entry[0], (h, key, value), h, shift + _BITS)
+            added = True
+    else:
+        new, added = _set(entry, h, key, value, shift + _BITS)
+        if new is entry:
+            return node, False
+    return _BitmapNode(node.bitmap, (*slots[:idx], new, *slots[idx + 1 :])), added
+
+
+def _delete(node: _Node, h: int, key: Any, shift: int) -> Any:
+    # returns the new node, None if it became empty, or _MISSING if key isn't present
+    if type(node) is _CollisionNode:
+        leaves = node.leaves
+        for i, (_, k, _v) in enumerate(leaves):
+            if k is key or k == key:
+                rest = (*leaves[:i], *leaves[i + 1 :])
+                # a lone leaf is pulled up into the parent
+                return rest[0] if len(rest) == 1 else _CollisionNode(node.hash, rest)
+        return _MISSING
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return _MISSING
+    idx = (node.bitmap & (bit - 1)).bit_count()
+    slots = node.slots
+    entry = slots[idx]
+    if type(entry) is tuple:
+        if not (entry[1] is key or entry[1] == key):
+            return _MISSING
+        new = None
+    else:
+        new = _delete(entry, h, key, shift + _BITS)
+        if new is _MISSING:
+            return _MISSING
+    if new is None:
+        bitmap = node.bitmap & ~bit
+        if not bitmap:
+            return None
+        rest = (*slots[:idx], *slots[idx + 1 :])
+        if len(rest) == 1 and type(rest[0]) is tuple and shift:
+            return rest[0]
+        return _BitmapNode(bitmap, rest)
+    if type(new) is tuple and len(slots) == 1 and shift:
+        return new
+    return _BitmapNode(node.bitmap, (*slots[:idx], new, *slots[idx + 1 :]))
+
+
+def _iter_leaves(node: _Node) -> Iterator[tuple[int, Any, Any]]:
+    if type(node) is _CollisionNode:
+        yield from node.leaves
+        return
+    for entry in node.slots:
+        if type(entry) is tuple:
+            yield entry
+        else:
+            yield from _iter_leaves(entry)
+
+
+class HAMT(Mapping[_KT, _VT], Generic[_KT, _VT]):
+    """
+    Immutable mapping with O(log n) functional updates.
+
+    >>> a = HAMT({1: 'x'})
+    >>> b = a.set(2, 'y')
+    >>> dict(a), dict(b)
+    ({1: 'x'}, {1: 'x', 2: 'y'})
+    >>> c = b.delete(1)
+    >>> dict(c), len(b)
+    ({2: 'y'}, 2)
+    """
+
+    __slots__ = ("_root", "_size")
+
+    _root: _Node
+    _size: int
+
+    def __init__(self, items: Mapping[_KT, _VT] | Iterable[tuple[_KT, _VT]] | None = None) -> None:
+        self._root = _EMPTY_NODE
+        self._size = 0
+        if items is not None:
+            root, size = self._root, 0
+            for key, value in items.items() if isinstance(items, Mapping) else items:
+                root, added = _set(root, _hash(key), key, value, 0)
+                size += added
+            self._root, self._size = root, size
+
+    @classmethod
+    def _make(cls, root: _Node, size: int) -> HAMT[_KT, _VT]:
+        new = cls.__new__(cls)
+        new._root = root
+        new._size = size
+        return new
+
+    def __getitem__(self, key: _KT, /) -> _VT:
+        value = _get(self._root, _hash(key), key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: _KT, default: Any = None, /) -> Any:
+        return _get(self._root, _hash(key), key, default)
+
+    def __contains__(self, key: object, /) -> bool:
+        return _get(self._root, _hash(key), key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[_KT]:
+        for _, key, _ in _iter_leaves(self._root):
+            yield key
+
+    def iter_items(self) -> Iterator[tuple[_KT, _VT]]:
+        for _, key, value in _iter_leaves(self._root):
+            yield key, value
+
+    def set(self, key: _KT, value: _VT) -> HAMT[_KT, _VT]:
+        root, added = _set(self._root, _hash(key), key, value, 0)
+        if root is self._root:
+            return self
+        return self._make(root, self._size + added)
+
+    def update(self, items: Mapping[_KT, _VT] | Iterable[tuple[_KT, _VT]]) -> HAMT[_KT, _VT]:
+        root, size = self._root, self._size
+        for key, value in items.items() if isinstance(items, Mapping) else items:
+            root, added = _set(root, _hash(key), key, value, 0)
+            size += added
+        return self if root is self._root else self._make(root, size)
+
+    def delete(self, key: _KT) -> HAMT[_KT, _VT]:
+        root = _delete(self._root, _hash(key), key, 0)
+        if root is _MISSING:
+            raise KeyError(key)
+        if root is None:
+            root = _EMPTY_NODE
+        return self._make(root, self._size - 1)
+
+    def __repr__(self) -> str:
+        return f"HAMT({dict(self.iter_items())!r})"
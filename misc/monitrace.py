@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import functools
+import operator
+import sys
+import threading
+import weakref
+from collections.abc import Callable, Generator, Iterable
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Any
+
+from codenames import code_names
+from monkeytype.tracing import CallTrace, CallTraceLogger, get_func
+from monkeytype.typing import get_type
+
+# MonkeyType's CallTracer hooks sys.setprofile(), which calls back into Python for every call and
+# return in the process whether or not the code is of interest. This backend does the same job
+# with sys.monitoring (PEP 669, 3.12+): PY_START/PY_RETURN/PY_YIELD callbacks return DISABLE the
+# first time they fire for code outside the selected modules, after which the interpreter stops
+# reporting those locations entirely and unselected code runs at full speed.
+HAVE_MONITORING = sys.version_info >= (3, 12)
+
+_UNSELECTED: Any = object()
+
+
+# weakref.ref() stand-in for callables that can't be weakly referenced
+class _StrongRef:
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any) -> None:
+        self.obj = obj
+
+    def __call__(self) -> Any:
+        return self.obj
+
+
+# Adaptive per code object sampling. Every call is traced at first. Once quiet_calls traced calls
+# in a row brought no new signature (argument types plus return type) the interval between traced
+# calls doubles, up to max_interval. Past that the code is parked: its events are DISABLEd like
+# unselected code, so hot functions cost nothing, and it is only sampled again when the tracer
+# wakes, by calling wake() or every wake_interval seconds if that is set (off by default). A new
+# signature in any sample puts the code straight back to tracing every call.
+# Waking goes through sys.monitoring.restart_events(), which is process wide: it re-enables every
+# DISABLEd location of every tool, so unselected code has to be DISABLEd again by this tracer and
+# other tools (coverage, profilers) see their disabled locations fire again too. Each wake costs
+# about one callback per distinct function that runs afterwards, so keep wake_interval in seconds
+# rather than fractions of one.
+@dataclass(frozen=True, slots=True)
+class SamplingPolicy:
+    quiet_calls: int = 1000
+    max_interval: int = 1024
+    wake_interval: float = 0
+
+    def __post_init__(self) -> None:
+        if self.quiet_calls <= 0 or self.max_interval <= 0:
+            raise ValueError(f"SamplingPolicy counts must be positive, got: {self}")
+        if self.wake_interval < 0:
+            raise ValueError(f"SamplingPolicy wake_interval must not be negative, got: {self}")
+
+
+@dataclass(slots=True, eq=False)
+class _CodeSampler:
+    interval: int = 1
+    countdown: int = 1
+    quiet: int = 0
+    parked: bool = False
+    # tracer wake epoch in which the code was parked or last sampled while parked
+    epoch: int = 0
+    # traced calls still running, a parked code's return is only DISABLEd once they are done
+    inflight: int = 0
+    signatures: set[Any] = field(default_factory=set)
+
+
+class MonitoringCallTracer:
+    logger: CallTraceLogger
+    max_typed_dict_size: int
+    modules: tuple[str, ...]
+    tool_id: int
+    sampling: SamplingPolicy | None
+    # frame -> trace of a call in progress (generators stay here across yields)
+    traces: dict[FrameType, CallTrace]
+    # id(code) -> (code ref, func ref, sampler), selected code only. Unselected code is DISABLEd
+    # on its first event and needs no entry. Both are held weakly so traced functions can still be
+    # collected, the entry is dropped when either dies (so the id can't be reused)
+    _funcs: dict[int, tuple[weakref.ref[CodeType], Callable[[], Any], _CodeSampler | None]]
+    _active: bool
+    _nparked: int
+    _epoch: int
+    _wake_stop: threading.Event
+    _waker: threading.Thread | None
+
+    def __init__(
+        self,
+        logger: CallTraceLogger,
+        max_typed_dict_size: int,
+        modules: Iterable[str],
+        tool_id: int | None = None,
+        sampling: SamplingPolicy | None = None,
+    ) -> None:
+        if not HAVE_MONITORING:
+            raise RuntimeError("MonitoringCallTracer requires sys.monitoring (Python 3.12+)")
+        self.logger = logger
+        self.max_typed_dict_size = max_typed_dict_size
+        self.modules = tuple(modules)
+        self.tool_id = tool_id if tool_id is not None else sys.monitoring.PROFILER_ID
+        self.sampling = sampling
+        self.traces = {}
+        self._funcs = {}
+        self._active = False
+        self._nparked = 0
+        self._epoch = 0
+        self._wake_stop = threading.Event()
+        self._waker = None
+
+    def _is_selected_module(self, module: str) -> bool:
+        return any(module == m or module.startswith(m + ".") for m in self.modules)
+
+    def _entry_for(self, code: CodeType, frame: FrameType) -> tuple[Any, _CodeSampler | None]:
+        # (func or _UNSELECTED, sampler)
+        ent = self._funcs.get(id(code), None)
+        if ent is not None and ent[0]() is code:
+            func = ent[1]()
+            if func is not None:
+                return func, ent[2]
+        if not self._is_selected_module(code_names.for_frame(frame).module):
+            return _UNSELECTED, None
+        # module level and class body code has no function, MonkeyType skips those too
+        func = get_func(frame)
+        if func is None:
+            return _UNSELECTED, None
+        sampler = _CodeSampler() if self.sampling is not None else None
+        key = id(code)
+        funcs = self._funcs
+
+        def drop(ref: weakref.ref[Any]) -> None:
+            ent = funcs.get(key, None)
+            if ent is not None and (ent[0] is ref or ent[1] is ref):
+                del funcs[key]
+
+        func_ref: Callable[[], Any]
+        try:
+            func_ref = weakref.ref(func, drop)
+        except TypeError:
+            # not weakly referenceable, keep it (and its code) alive
+            func_ref = _StrongRef(func)
+        funcs[key] = (weakref.ref(code, drop), func_ref, sampler)
+        return func, sampler
+
+    def _on_start(self, code: CodeType, offset: int) -> Any:
+        frame = sys._getframe(1)
+        func, sampler = self._entry_for(code, frame)
+        if func is _UNSELECTED:
+            return sys.monitoring.DISABLE
+        if sampler is not None:
+            if sampler.parked:
+                if sampler.epoch == self._epoch:
+                    # not woken since it was parked or last sampled
+                    return sys.monitoring.DISABLE
+                sampler.epoch = self._epoch
+            else:
+                sampler.countdown -= 1
+                if sampler.countdown > 0:
+                    return None
+                sampler.countdown = sampler.interval
+        f_locals = frame.f_locals
+        arg_types = {}
+        for name in code.co_varnames[: code.co_argcount]:
+            if name in f_locals:
+                arg_types[name] = get_type(
+                    f_locals[name], max_typed_dict_size=self.max_typed_dict_size
+                )
+        self.traces[frame] = CallTrace(func, arg_types)
+        if sampler is not None:
+            sampler.inflight += 1
+            if sampler.parked:
+                # woken up for one sample, stay parked unless it turns out to be new
+                return sys.monitoring.DISABLE
+        return None
+
+    def _untraced_event(self, code: CodeType) -> Any:
+        ent = self._funcs.get(id(code), None)
+        if ent is None or ent[0]() is not code:
+            return sys.monitoring.DISABLE
+        sampler = ent[2]
+        if sampler is not None and sampler.parked and not sampler.inflight:
+            return sys.monitoring.DISABLE
+        return None
+
+    def _finish(self, code: CodeType, trace: CallTrace) -> Any:
+        self.logger.log(trace)
+        ent = self._funcs.get(id(code), None)
+        sampler = ent[2] if ent is not None and ent[0]() is code else None
+        if sampler is None:
+            return None
+        sampler.inflight -= 1
+        self._observe(sampler, (tuple(trace.arg_types.items()), trace.return_type))
+        if sampler.parked and not sampler.inflight:
+            return sys.monitoring.DISABLE
+        return None
+
+    def _observe(self, sampler: _CodeSampler, signature: Any) -> None:
+        policy = self.sampling
+        assert policy is not None
+        if signature not in sampler.signatures:
+            sampler.signatures.add(signature)
+            sampler.interval = sampler.countdown = 1
+            sampler.quiet = 0
+            if sampler.parked:
+                sampler.parked = False
+                self._nparked -= 1
+                # its start event is DISABLEd, turn it back on right away
+                sys.monitoring.restart_events()
+            return
+        sampler.quiet += 1
+        if sampler.quiet < policy.quiet_calls or sampler.parked:
+            return
+        sampler.quiet = 0
+        sampler.interval *= 2
+        sampler.countdown = sampler.interval
+        if sampler.interval > policy.max_interval:
+            sampler.parked = True
+            sampler.epoch = self._epoch
+            self._nparked += 1
+
+    def _on_return(self, code: CodeType, offset: int, retval: Any) -> Any:
+        trace = self.traces.pop(sys._getframe(1), None)
+        if trace is None:
+            return self._untraced_event(code)
+        trace.return_type = get_type(retval, max_typed_dict_size=self.max_typed_dict_size)
+        return self._finish(code, trace)
+
+    def _on_yield(self, code: CodeType, offset: int, retval: Any) -> Any:
+        trace = self.traces.get(sys._getframe(1), None)
+        if trace is None:
+            return self._untraced_event(code)
+        trace.add_yield_type(get_type(retval, max_typed_dict_size=self.max_typed_dict_size))
+        return None
+
+    def _on_unwind(self, code: CodeType, offset: int, exc: BaseException) -> None:
+        # fires for every function an exception propagates out of and can't be disabled
+        # (returning DISABLE here switches unwind events off for good), log without a return type
+        # like MonkeyType does
+        if self.traces:
+            trace = self.traces.pop(sys._getframe(1), None)
+            if trace is not None:
+                self._finish(code, trace)
+
+    def wake(self) -> None:
+        # sample every parked code object once more on its next call, see SamplingPolicy for what
+        # this does to other sys.monitoring tools
+        if self._active and self._nparked:
+            self._epoch += 1
+            sys.monitoring.restart_events()
+
+    def _wake_loop(self, interval: float) -> None:
+        while not self._wake_stop.wait(interval):
+            self.wake()
+
+    def start(self) -> None:
+        if self._active:
+            raise RuntimeError("MonitoringCallTracer is already started")
+        mon = sys.monitoring
+        events = mon.events
+        mon.use_tool_id(self.tool_id, "monkeytype-sandbox")
+        callbacks: dict[int, Callable[..., Any]] = {
+            events.PY_START: self._on_start,
+            events.PY_RETURN: self._on_return,
+            events.PY_YIELD: self._on_yield,
+            events.PY_UNWIND: self._on_unwind,
+        }
+        for event, callback in callbacks.items():
+            mon.register_callback(self.tool_id, event, callback)
+        # locations DISABLEd by an earlier session would otherwise stay silent
+        mon.restart_events()
+        mon.set_events(self.tool_id, functools.reduce(operator.or_, callbacks))
+        self._active = True
+        if self.sampling is not None and self.sampling.wake_interval > 0:
+            self._wake_stop.clear()
+            self._waker = threading.Thread(
+                target=self._wake_loop,
+                args=(self.sampling.wake_interval,),
+                name="monitrace-wake",
+                daemon=True,
+            )
+            self._waker.start()
+
+    def stop(self) -> None:
+        if not self._active:
+            return
+        if self._waker is not None:
+            self._wake_stop.set()
+            self._waker.join()
+            self._waker = None
+        mon = sys.monitoring
+        events = mon.events
+        mon.set_events(self.tool_id, 0)
+        for event in (events.PY_START, events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+            mon.register_callback(self.tool_id, event, None)
+        mon.free_tool_id(self.tool_id)
+        self._active = False
+        # calls still in progress (e.g. suspended generators) are logged as they are
+        for trace in self.traces.values():
+            self.logger.log(trace)
+        self.traces.clear()
+        self.logger.flush()
+
+
+@contextmanager
+def trace_calls_monitoring(
+    logger: CallTraceLogger,
+    max_typed_dict_size: int,
+    modules: Iterable[str],
+    tool_id: int | None = None,
+    sampling: SamplingPolicy | None = None,
+) -> Generator[MonitoringCallTracer, None, None]:
+    # sys.monitoring counterpart of monkeytype.tracing.trace_calls()
+    tracer = MonitoringCallTracer(logger, max_typed_dict_size, modules, tool_id, sampling)
+    tracer.start()
+    try:
+        yield tracer
+    finally:
+        tracer.stop()
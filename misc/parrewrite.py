@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import collections
+import multiprocessing.context
+import os
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any, cast
+
+from f15 import (
+    AnnotatedMethod,
+    GenericTypeRewriter,
+    NamePath,
+    get_namepath,
+    register_rewrite,
+    resolve_namepath,
+)
+from typetree import TypeNode, TypeTreeRewriter
+
+if not TYPE_CHECKING:
+    try:
+        from rich import print
+    except ImportError:
+        pass
+
+# One corpus shard: a traced module name and the annotations collected for it.
+ModuleShard = tuple[str, Sequence[Any]]
+
+# One rule of the rewriter's registry as sent to the workers: (owner class, rule name, target,
+# lazy, function). function is the NamePath of a module level function for rules added with
+# add_rewrite_method(), None for rules defined in the owner's class body.
+RuleRow = tuple[NamePath, str, NamePath, bool, NamePath | None]
+
+# Per worker process state, set up once by _init_worker().
+_worker_rewriter: TypeTreeRewriter | None = None
+
+
+def _rule_rows(rewriter_cls: type[TypeTreeRewriter]) -> list[RuleRow]:
+    # base classes first so rules added to a base are in place before its subclasses'
+    rows: list[RuleRow] = []
+    for owner in reversed(rewriter_cls.__mro__):
+        if not issubclass(owner, GenericTypeRewriter):
+            continue
+        owner_np = get_namepath(owner)
+        for tgt_np, info in vars(owner).get("_cls_rewrite_meths", {}).items():
+            method = cast("AnnotatedMethod[Any, ..., Any]", info.method)
+            func = method.__wrapped__
+            func_np: NamePath | None = get_namepath(func)
+            if func_np == NamePath(owner_np.module, f"{owner_np.qualname}.{info.name}"):
+                # defined in the class body, importing the owner's module recreates it
+                func_np = None
+            else:
+                try:
+                    importable = resolve_namepath(func_np).value is func
+                except (ImportError, AttributeError):
+                    importable = False
+                if not importable:
+                    raise ValueError(
+                        f"Rewrite method {info.self_namepath} added at runtime must be a module "
+                        f"level function to be sent to worker processes: {func_np}"
+                    )
+            rows.append((owner_np, info.name, tgt_np, method._lazy, func_np))
+    return rows
+
+
+def _init_worker(rewriter_np: NamePath, rows: list[RuleRow]) -> None:
+    # Re-create the rewriter from its NamePath: importing the defining module re-runs the class
+    # bodies and so rebuilds the registry in this process, then rules added with
+    # add_rewrite_method() in the parent (missing under spawn and forkserver) are added again.
+    # Nothing live crosses the process boundary, rule targets are resolved lazily here like
+    # anywhere else.
+    global _worker_rewriter
+    rewriter_cls = resolve_namepath(rewriter_np).value
+    for owner_np, name, tgt_np, lazy, func_np in rows:
+        owner = resolve_namepath(owner_np).value
+        info = vars(owner)["_cls_rewrite_meths"].get(tgt_np, None)
+        if (info is not None and info.name == name) or func_np is None:
+            continue
+        func = resolve_namepath(func_np).value
+        owner.add_rewrite_method(
+            name, register_rewrite(tgt_np.module, tgt_np.qualname, lazy=lazy)(func)
+        )
+    _worker_rewriter = rewriter_cls()
+
+
+def _rewrite_shard(shard: ModuleShard) -> tuple[str, list[TypeNode]]:
+    assert _worker_rewriter is not None
+    module, anns = shard
+    rewrite_tree = _worker_rewriter.rewrite_tree
+    return module, [rewrite_tree(TypeNode.from_annotation(ann)) for ann in anns]
+
+
+def rewrite_corpus(
+    rewriter_cls: type[TypeTreeRewriter],
+    corpus: Iterable[ModuleShard],
+    max_workers: int | None = None,
+    window: int | None = None,
+    mp_context: multiprocessing.context.BaseContext | None = None,
+) -> Iterator[tuple[str, list[TypeNode]]]:
+    # Shard a stub corpus by module across a process pool. Results stream back in corpus order,
+    # at most window shards are in flight so the corpus iterable is consumed incrementally
+    # (ProcessPoolExecutor.map() would submit all of it up front). The returned TypeNodes are
+    # re-interned on unpickling so they are shared with the rest of this process.
+    rewriter_np = get_namepath(rewriter_cls)
+    if "<locals>" in rewriter_np.qualname:
+        raise ValueError(f"Rewriter class must be importable by worker processes: {rewriter_np}")
+    rows = _rule_rows(rewriter_cls)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if window is None:
+        window = 4 * max_workers
+    if window <= 0:
+        raise ValueError(f"window must be positive, got: {window}")
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(rewriter_np, rows),
+    ) as ex:
+        inflight: collections.deque[Future[tuple[str, list[TypeNode]]]] = collections.deque()
+        for shard in corpus:
+            if len(inflight) >= window:
+                yield inflight.popleft().result()
+            inflight.append(ex.submit(_rewrite_shard, shard))
+        while inflight:
+            yield inflight.popleft().result()
+
+
+if __name__ == "__main__":
+    import typing
+
+    from typetree import OptionalTreeRewriter
+
+    corpus = [
+        (f"mod{i}", [typing.Union[int, None], dict[str, list[int] | None], tuple[int, ...]])
+        for i in range(4)
+    ]
+    for module, nodes in rewrite_corpus(OptionalTreeRewriter, corpus, max_workers=2):
+        print(module, [n.to_annotation() for n in nodes])
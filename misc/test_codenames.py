@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import sys
+
+import pytest
+from codenames import (
+    MODULE_QUALNAME,
+    CodeNameResolver,
+    code_namepath,
+    format_namepath,
+    frame_namepath,
+)
+from f15 import NamePath
+
+MODULE_CODE_FRAME = sys._getframe()
+
+
+class Outer:
+    class Inner:
+        def meth(self):
+            def nested():
+                return sys._getframe()
+
+            return nested()
+
+
+class TestCodeNames:
+    def test_nested_qualname(self):
+        np = frame_namepath(Outer.Inner().meth())
+        assert np == NamePath(__name__, "Outer.Inner.meth.<locals>.nested")
+        assert format_namepath(np) == f"{__name__}.Outer.Inner.meth.<locals>.nested"
+
+    def test_module_code(self):
+        np = frame_namepath(MODULE_CODE_FRAME)
+        assert np.qualname == MODULE_QUALNAME
+        assert format_namepath(np) == __name__
+
+    def test_cached_per_code(self):
+        resolver = CodeNameResolver()
+        frame = Outer.Inner().meth()
+        np = resolver.for_frame(frame)
+        assert resolver.for_frame(Outer.Inner().meth()) is np
+        assert resolver.for_code(frame.f_code) is np
+        assert len(resolver) == 1
+
+    def test_code_without_globals(self):
+        resolver = CodeNameResolver()
+        np = resolver.for_code(Outer.Inner.meth.__code__)
+        assert np == NamePath(__name__, "Outer.Inner.meth")
+        assert code_namepath(Outer.Inner.meth.__code__, globals()) == np
+        code = compile("x = 1", "<not a module>", "exec")
+        assert resolver.for_code(code) == NamePath("<not a module>", MODULE_QUALNAME)
+
+    def test_identical_code_in_different_modules(self):
+        src = "def f():\n    pass\n"
+        ns_a = {"__name__": "mod_a"}
+        ns_b = {"__name__": "mod_b"}
+        exec(compile(src, "<same>", "exec"), ns_a)
+        exec(compile(src, "<same>", "exec"), ns_b)
+        assert ns_a["f"].__code__ == ns_b["f"].__code__
+        resolver = CodeNameResolver()
+        assert resolver.for_code(ns_a["f"].__code__, ns_a).module == "mod_a"
+        assert resolver.for_code(ns_b["f"].__code__, ns_b).module == "mod_b"
+
+    def test_bounded(self):
+        resolver = CodeNameResolver(maxsize=2)
+        for func in (Outer.Inner.meth, TestCodeNames.test_bounded, format_namepath):
+            resolver.for_code(func.__code__)
+        assert len(resolver) == 2
+        with pytest.raises(ValueError):
+            CodeNameResolver(maxsize=0)
+
+    def test_doesnt_grow_intern_table(self):
+        import f15
+
+        ns = {"__name__": "codenames_exec"}
+        exec(compile("def f():\n    pass\n", "<codenames exec>", "exec"), ns)
+        np = CodeNameResolver().for_code(ns["f"].__code__, ns)
+        assert np == NamePath("codenames_exec", "f")
+        assert ("codenames_exec", "f") not in f15._namepath_interned
+        canonical = NamePath.intern(__name__, "Outer.Inner.meth")
+        assert CodeNameResolver().for_code(Outer.Inner.meth.__code__) is canonical
+
+
+if __name__ == "__main__":  # pragma: no cover
+    pytest.main([__file__])
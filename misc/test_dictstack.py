@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 
+import random
+import time
+import timeit
+from collections import ChainMap
 from collections.abc import MutableMapping, MutableSequence
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 from types import MappingProxyType
+from typing import Any
 
 import pytest
-from dictstack import DictStack
+from dictstack import DictStack, FrozenDictStack
 from rich import print
 from rich import print as rprint
 
@@ -19,9 +26,322 @@ class TestDictStack:
         assert stack["b"] == 2
         assert stack["c"] == 2
 
+    def test_indexed_matches_scan(self):
+        rng = random.Random(15)
+        plain = DictStack([{}])
+        indexed = DictStack([{}], indexed=True)
+        for _ in range(2000):
+            op = rng.randrange(4)
+            key = rng.randrange(20)
+            for stack in (plain, indexed):
+                if op == 0:
+                    stack[key] = key
+                elif op == 1 and key in stack.dicts[-1]:
+                    del stack[key]
+                elif op == 2:
+                    stack.pushdict({key: -key})
+                elif len(stack.dicts) > 1:
+                    stack.popdict(-1 if key % 2 else 0)
+            assert len(indexed) == len(plain)
+            assert set(indexed) == set(plain)
+            assert dict(indexed) == dict(plain)
+        assert copy(indexed).indexed
+        assert set(copy(indexed)) == set(indexed)
+
+    def test_indexed_copy_writes_leave_original_alone(self):
+        stack = DictStack([{"a": 1}, {}], indexed=True)
+        c = copy(stack)
+        c["b"] = 2
+        c.popdict()
+        c["c"] = 3
+        del c["a"]
+        assert stack.dicts == [{"a": 1}, {}]
+        assert len(stack) == 1
+        assert list(stack) == ["a"]
+        assert stack["a"] == 1
+        with pytest.raises(KeyError):
+            stack["b"]
+        assert dict(c) == {"c": 3}
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_write_while_iterating(self, indexed):
+        stack = DictStack([{"a": 1}, {"b": 2}], indexed=indexed)
+        for key in stack:
+            stack[key + "x"] = 1
+        assert list(stack) == ["a", "b", "ax", "bx"]
+
+    def test_owner_cache(self):
+        stack = DictStack([{"g": 0}] + [{i: i} for i in range(100)], indexed=True)
+        assert stack["g"] == 0
+        assert stack._owners == {"g": 0}
+        stack.pushdict({"g": 1})
+        assert stack["g"] == 1
+        stack["g"] = 2
+        assert stack["g"] == 2
+        del stack["g"]
+        assert stack["g"] == 0
+        stack.pushdict({"g": 3})
+        assert stack["g"] == 3
+        stack.popdict()
+        assert stack["g"] == 0
+        assert stack[50] == 50
+        stack.popdict(0)
+        assert not stack._owners
+        assert stack[50] == 50
+        with pytest.raises(KeyError):
+            stack["g"]
+
+    def test_versioned_mapping(self):
+        rng = random.Random(17)
+        stack = DictStack([{}], indexed=True)
+        snaps = []
+        for _ in range(1000):
+            version = stack.version
+            op = rng.randrange(5)
+            key = rng.randrange(30)
+            if op == 0:
+                stack[key] = rng.random()
+            elif op == 1 and key in stack.dicts[-1]:
+                del stack[key]
+            elif op == 2:
+                stack.pushdict({key: -key, key + 1: key})
+            elif op == 3 and len(stack.dicts) > 1:
+                stack.popdict(-1 if key % 2 else 0)
+            else:
+                snap = stack.mapping
+                assert stack.mapping is snap
+                assert snap == dict(stack)
+                snaps.append((snap, dict(snap)))
+                continue
+            assert stack.version > version
+        for snap, frozen in snaps:
+            assert snap == frozen
+        assert DictStack([{"a": 1}]).mapping == {"a": 1}
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_checkpoint_rollback(self, indexed):
+        rng = random.Random(18)
+        stack = DictStack([{i: i for i in range(1000)}], indexed=indexed)
+        saved = []
+        for _ in range(2000):
+            op = rng.randrange(7)
+            key = rng.randrange(30)
+            if op == 0:
+                stack[key] = rng.random()
+            elif op == 1 and key in stack.dicts[-1]:
+                del stack[key]
+            elif op == 2:
+                stack.pushdict({key: -key})
+            elif op == 3 and len(stack.dicts) > 1:
+                stack.popdict(rng.randrange(len(stack.dicts)))
+            elif op == 4:
+                saved.append(([dict(d) for d in stack.dicts], stack.checkpoint()))
+            elif op == 5 and saved:
+                layers, token = saved.pop()
+                stack.rollback(token)
+                assert stack.dicts == layers
+                assert dict(stack) == dict(DictStack(layers))
+                assert len(stack) == len(DictStack(layers))
+            elif op == 6 and saved:
+                stack.commit(saved.pop()[1])
+        while saved:
+            layers, token = saved.pop()
+            stack.rollback(token)
+        assert stack._undo is None
+
+    def test_checkpoint_lifo(self):
+        stack = DictStack([{}])
+        outer = stack.checkpoint()
+        inner = stack.checkpoint()
+        with pytest.raises(ValueError):
+            stack.commit(outer)
+        stack.commit(inner)
+        with pytest.raises(ValueError):
+            stack.rollback(inner)
+        stack.rollback(outer)
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_bulk_matches_single(self, indexed):
+        rng = random.Random(20)
+        single = DictStack([{i: i for i in range(50)}, {}], indexed=indexed)
+        bulk = DictStack([{i: i for i in range(50)}, {}], indexed=indexed)
+        for i in range(200):
+            keys = rng.sample(range(100), rng.randrange(1, 20))
+            if i % 3:
+                items = dict.fromkeys(keys, i)
+                for key, val in items.items():
+                    single[key] = val
+                bulk.update_many(items.items() if i % 2 else items)
+            else:
+                keys = [key for key in keys if key in single.dicts[-1]]
+                for key in keys:
+                    del single[key]
+                bulk.delete_many(keys + keys)
+            if i % 7 == 0:
+                prebuilt = {key: -key for key in keys}
+                single.pushdict(dict(prebuilt))
+                bulk.pushdict(prebuilt)
+                assert bulk.dicts[-1] is prebuilt
+            assert bulk.dicts == single.dicts
+            assert len(bulk) == len(single)
+            assert dict(bulk.mapping) == dict(single.mapping)
+
+    def test_bulk_rollback(self):
+        stack = DictStack([{"a": 1}], indexed=True)
+        token = stack.checkpoint()
+        stack.update_many({"a": 2, "b": 3})
+        stack.delete_many(["a"])
+        stack.rollback(token)
+        assert stack.dicts == [{"a": 1}]
+        assert len(stack) == 1
+        with pytest.raises(KeyError):
+            stack.delete_many(["a", "missing"])
+        assert stack.dicts == [{"a": 1}]
+
+    def test_trace_hook(self):
+        calls = []
+        stack = DictStack([{}], name="t", trace=lambda *args: calls.append(args))
+        stack["a"] = 1
+        stack.update_many({"b": 2})
+        stack.delete_many(["a"])
+        stack.trace = None
+        stack["c"] = 3
+        assert calls == [
+            (stack, "__setitem__", ("a",)),
+            (stack, "update_many", ("b",)),
+            (stack, "delete_many", ("a",)),
+        ]
+
+    def test_bench_getitem(self):
+        assert set(bench_getitem(depths=(1, 10), number=10)) == {1, 10}
+
+    def test_bench_bulk(self):
+        assert set(bench_bulk(nkeys=10, number=1)) == set(BULK_CASES)
+
+
+class TestFrozenDictStack:
+    def test_matches_dictstack(self):
+        rng = random.Random(19)
+        stack = DictStack([{}])
+        frozen = FrozenDictStack([{}])
+        history = []
+        for i in range(2000):
+            op = rng.randrange(4)
+            key = rng.randrange(30)
+            if op == 0:
+                stack[key] = i
+                frozen = frozen.set(key, i)
+            elif op == 1 and key in stack.dicts[-1]:
+                del stack[key]
+                frozen = frozen.delete(key)
+            elif op == 2:
+                stack.pushdict({key: -key})
+                frozen = frozen.pushdict({key: -key})
+            elif len(stack.dicts) > 1:
+                stack.popdict()
+                frozen, _ = frozen.popdict()
+            assert len(frozen) == len(stack)
+            assert dict(frozen) == dict(stack)
+            assert frozen.depth == len(stack.dicts)
+            history.append((frozen, dict(stack)))
+        for old, expected in history:
+            assert dict(old) == expected
+        assert frozen.dicts == stack.dicts
+        assert frozen.thaw().dicts == stack.dicts
+
+    def test_empty(self):
+        frozen = FrozenDictStack()
+        with pytest.raises(IndexError):
+            frozen["a"]
+        with pytest.raises(IndexError):
+            frozen.set("a", 1)
+        with pytest.raises(IndexError):
+            frozen.popdict()
+        with pytest.raises(KeyError):
+            frozen.pushdict().delete("a")
+
+    def test_threads_share_base(self):
+        base = FrozenDictStack([{f"g{i}": i for i in range(1000)}])
+
+        def worker(n):
+            stack = base.pushdict({"n": n})
+            for i in range(100):
+                stack = stack.set(f"g{i}", n)
+            return dict(stack)
+
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            results = list(ex.map(worker, range(32)))
+        for n, res in enumerate(results):
+            assert res["n"] == n
+            assert res["g0"] == n
+            assert res["g500"] == 500
+        assert "n" not in base
+        assert base["g0"] == 0
+
+
+def _deep_stacks(depth: int) -> dict[str, Any]:
+    # globals at the bottom, depth - 1 small scopes on top, reads fall all the way through
+    layers = [{"g": 0}] + [{f"l{d}_{i}": i for i in range(4)} for d in range(1, depth)]
+    return {
+        "ChainMap": ChainMap(*reversed(layers)),
+        "DictStack scan": DictStack(layers),
+        "DictStack indexed": DictStack(layers, indexed=True),
+    }
+
+
+def bench_getitem(
+    depths: tuple[int, ...] = (1, 10, 100, 1000), number: int = 100_000
+) -> dict[int, dict[str, float]]:
+    results: dict[int, dict[str, float]] = {}
+    for depth in depths:
+        results[depth] = {}
+        for case, mapping in _deep_stacks(depth).items():
+            timer = timeit.Timer("m['g']", globals={"m": mapping})
+            results[depth][case] = min(timer.repeat(repeat=3, number=number)) / number * 1e9
+    return results
+
+
+def _seed_setitem(stack: DictStack, items: dict[str, int]) -> None:
+    for key, val in items.items():
+        stack[key] = val
+
+
+BULK_CASES = {
+    "__setitem__ loop": _seed_setitem,
+    "update_many": lambda stack, items: stack.update_many(items),
+    "pushdict owned": lambda stack, items: stack.pushdict(items),
+    "delete_many": lambda stack, items: (stack.update_many(items), stack.delete_many(items)),
+}
+
+
+def bench_bulk(nkeys: int = 10_000, number: int = 20) -> dict[str, dict[str, float]]:
+    # bindings seeded per second into a fresh scope on top of a 100 layer stack
+    results: dict[str, dict[str, float]] = {}
+    base = [{f"g{d}_{i}": i for i in range(10)} for d in range(100)]
+    for case, seed in BULK_CASES.items():
+        results[case] = {}
+        for mode, indexed in (("plain", False), ("indexed", True)):
+            best = float("inf")
+            for _ in range(number):
+                stack = DictStack(base, indexed=indexed)
+                if case != "pushdict owned":
+                    stack.pushdict()
+                items = {f"k{i}": i for i in range(nkeys)}
+                t0 = time.perf_counter()
+                seed(stack, items)
+                best = min(best, time.perf_counter() - t0)
+            results[case][mode] = nkeys / best
+    return results
+
 
 if __name__ == "__main__":  # pragma: no cover
     pytest.main([__file__])
     MutableMapping._dump_registry()
     MutableSequence._dump_registry()
     print(MappingProxyType(DictStack([dict(a=1, c=2), dict(b=2, a=2)])))
+    for depth, cases in bench_getitem().items():
+        for case, ns in cases.items():
+            print(f"getitem depth {depth:5} {case:>17}: {ns:10.1f} ns")
+    for case, modes in bench_bulk().items():
+        for mode, rate in modes.items():
+            print(f"bulk {case:>16} {mode:>7}: {rate / 1e6:8.2f} M keys/s")
@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+
+import importlib
+import sys
+from typing import Any
+
+import f15
+import pytest
+from f15 import (
+    AMI,
+    AMIS,
+    GenericTypeRewriter,
+    MuhrivedTypeRewriter,
+    NamePath,
+    NamePathCache,
+    NoRewriteMethodError,
+    TypeRewriter,
+    disable_instrumentation,
+    enable_instrumentation,
+    get_instrumentation,
+    register_rewrite,
+)
+from f15_ext import DerivedTypeRewriter, DubDerTypeRewriter
+
+np_t = NamePath("typing", "Union")
+np_c = NamePath("pycparser.c_ast", "Union")
+np_s = NamePath("construct", "Union")
+
+
+def mro_walk_rewrite_method_for(cls, namepath):
+    for mcls in cls.mro():
+        if not issubclass(mcls, GenericTypeRewriter):
+            continue
+        rewriter = mcls.rewrite_methods().get(namepath, None)
+        if rewriter is not None:
+            return rewriter
+    return None
+
+
+class TestDispatch:
+    def test_dispatch_matches_mro_walk(self):
+        for cls in (TypeRewriter, MuhrivedTypeRewriter, DerivedTypeRewriter, DubDerTypeRewriter):
+            for np in (np_t, np_c, np_s):
+                expected = mro_walk_rewrite_method_for(cls, np)
+                if expected is None:
+                    with pytest.raises(KeyError):
+                        cls.rewrite_method_for(np)
+                else:
+                    assert cls.rewrite_method_for(np) is expected
+
+    def test_dispatch_c3(self):
+        assert DubDerTypeRewriter.rewrite_method_for(np_c).name == "dub_rewrite_c_ast_Union"
+        assert DubDerTypeRewriter.rewrite_method_for(np_t).name == "der_rewrite_typing_Union"
+        assert DubDerTypeRewriter.rewrite_method_for(np_s).name == "muh_rewrite_construct_Union"
+
+    def test_add_rewrite_method_rebuilds_subclasses(self):
+        class BaseTR(GenericTypeRewriter):
+            pass
+
+        class SubTR(BaseTR):
+            pass
+
+        np_d = NamePath("dataclasses", "dataclass")
+        with pytest.raises(KeyError):
+            SubTR.rewrite_method_for(np_d)
+
+        def rewrite_dataclass(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+            return a - b
+
+        BaseTR.add_rewrite_method(
+            "rewrite_dataclass", register_rewrite("dataclasses", "dataclass")(rewrite_dataclass)
+        )
+        assert SubTR.rewrite_method_for(np_d).name == "rewrite_dataclass"
+        assert SubTR().rewrite_type(np_d, 5, 3) == 2
+
+    def test_add_rewrite_method_duplicate_leaves_class_alone(self):
+        class DupTR(GenericTypeRewriter):
+            @register_rewrite("dataclasses", "dataclass")
+            def rewrite_dataclass(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a - b
+
+        def other(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+            return a + b
+
+        np_d = NamePath("dataclasses", "dataclass")
+        old = DupTR.rewrite_dispatch()[np_d]
+        with pytest.raises(ValueError):
+            DupTR.add_rewrite_method("other", register_rewrite("dataclasses", "dataclass")(other))
+        with pytest.raises(ValueError):
+            DupTR.add_rewrite_method("rewrite_dataclass", register_rewrite("json", "dumps")(other))
+        assert "other" not in vars(DupTR)
+        assert len(DupTR._namespaces[DupTR]) == 1
+        assert DupTR.rewrite_dispatch()[np_d] is old
+        assert DupTR().rewrite_type(np_d, 5, 3) == 2
+
+
+class TestLazyResolve:
+    def test_lazy_target_not_imported(self):
+        class LazyTR(GenericTypeRewriter):
+            @register_rewrite("xml.dom.minidom", "Node")
+            def rewrite_minidom_Node(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return meta.resolved.value.ELEMENT_NODE
+
+        if "xml.dom.minidom" in sys.modules:
+            pytest.skip("xml.dom.minidom already imported")
+        info = LazyTR.rewrite_method_for(NamePath("xml.dom.minidom", "Node"))
+        assert not info.method.is_resolved
+        assert "xml.dom.minidom" not in sys.modules
+        assert LazyTR().rewrite_type(NamePath("xml.dom.minidom", "Node"), 0, 0) == 1
+        assert info.method.is_resolved
+        assert info.resolved.module is sys.modules["xml.dom.minidom"]
+
+    def test_loaded_target_resolved_eagerly(self):
+        info = TypeRewriter.rewrite_method_for(np_t)
+        assert info.method.is_resolved
+        assert info.resolved.value.__name__ == "Union"
+
+
+class TestIdentityDispatch:
+    def test_object_dispatch(self):
+        import typing
+
+        assert TypeRewriter.rewrite_method_for_object(typing.Union).name == "rewrite_typing_Union"
+        assert (
+            DubDerTypeRewriter.rewrite_method_for_object(typing.Union).name
+            == "der_rewrite_typing_Union"
+        )
+        with pytest.raises(KeyError):
+            TypeRewriter.rewrite_method_for_object(typing.Optional)
+
+    def test_alias_hits_same_rule(self):
+        import builtins
+        import io
+
+        class AliasTR(GenericTypeRewriter):
+            @register_rewrite("io", "open")
+            def rewrite_io_open(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a + b
+
+        assert io.open is builtins.open
+        assert AliasTR.rewrite_method_for_object(builtins.open).name == "rewrite_io_open"
+        assert AliasTR().rewrite_object(open, 1, 2) == 3
+
+    def test_pending_rule_picked_up_after_import(self):
+        class PendingTR(GenericTypeRewriter):
+            @register_rewrite("xml.sax.handler", "ContentHandler")
+            def rewrite_ContentHandler(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a + b
+
+        if "xml.sax.handler" in sys.modules:
+            pytest.skip("xml.sax.handler already imported")
+        assert PendingTR._cls_rewrite_pending
+        from xml.sax.handler import ContentHandler
+
+        assert PendingTR.rewrite_method_for_object(ContentHandler).name == "rewrite_ContentHandler"
+        assert not PendingTR._cls_rewrite_pending
+
+    def test_identity_index_built_on_first_object_lookup(self):
+        class LazyIdTR(GenericTypeRewriter):
+            @register_rewrite("builtins", "open")
+            def rewrite_open(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a + b
+
+        assert LazyIdTR._cls_rewrite_dispatch_by_id == {}
+        assert LazyIdTR._cls_rewrite_pending == tuple(LazyIdTR.rewrite_dispatch().values())
+        assert LazyIdTR.rewrite_method_for_object(open).name == "rewrite_open"
+        assert id(open) in LazyIdTR._cls_rewrite_dispatch_by_id
+        assert not LazyIdTR._cls_rewrite_pending
+
+
+class TestNegativeLookup:
+    def test_lookup_miss_returns_none(self):
+        np_d = NamePath("dataclasses", "dataclass")
+        assert TypeRewriter.lookup_rewrite_method(np_d) is None
+        assert TypeRewriter.lookup_rewrite_method(np_t) is TypeRewriter.rewrite_method_for(np_t)
+        assert TypeRewriter.lookup_rewrite_method_for_object(object()) is None
+
+    def test_miss_error_is_keyerror(self):
+        np_d = NamePath("dataclasses", "dataclass")
+        with pytest.raises(KeyError) as exc:
+            DubDerTypeRewriter.rewrite_method_for(np_d)
+        assert isinstance(exc.value, NoRewriteMethodError)
+        assert exc.value.target is np_d
+        assert str(exc.value) == f"No rewrite method for NP: {np_d}"
+        with pytest.raises(NoRewriteMethodError, match="No rewrite method for object"):
+            TypeRewriter.rewrite_method_for_object(object())
+
+    def test_pending_negative_cache(self, monkeypatch):
+        class NegTR(GenericTypeRewriter):
+            @register_rewrite("f15_not_a_module", "Thing")
+            def rewrite_Thing(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a + b
+
+        assert NegTR._cls_rewrite_pending
+        builds = []
+        orig = NegTR._build_identity_dispatch.__func__
+        monkeypatch.setattr(
+            NegTR, "_build_identity_dispatch", classmethod(lambda c: builds.append(orig(c)))
+        )
+        assert NegTR.lookup_rewrite_method_for_object(object()) is None
+        checked = NegTR._cls_pending_checked
+        assert checked == len(sys.modules)
+        assert NegTR.lookup_rewrite_method_for_object(object()) is None
+        assert NegTR._cls_pending_checked == checked
+        thing = type("Thing", (), {})
+        mod = type(sys)("f15_not_a_module")
+        mod.Thing = thing
+        monkeypatch.setitem(sys.modules, "f15_not_a_module", mod)
+        assert NegTR.rewrite_method_for_object(thing).name == "rewrite_Thing"
+        assert len(builds) == 1
+
+    def test_broken_target_doesnt_fail_object_lookups(self, monkeypatch):
+        import typing
+
+        class BrokenTR(GenericTypeRewriter):
+            @register_rewrite("f15_broken_target", "nope")
+            def rewrite_nope(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a + b
+
+            @register_rewrite("builtins", "open")
+            def rewrite_open(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a * b
+
+        monkeypatch.setitem(sys.modules, "f15_broken_target", type(sys)("f15_broken_target"))
+        assert BrokenTR.lookup_rewrite_method_for_object(typing.Optional) is None
+        with pytest.raises(NoRewriteMethodError):
+            BrokenTR.rewrite_method_for_object(typing.Optional)
+        assert BrokenTR.rewrite_method_for_object(open).name == "rewrite_open"
+        assert not BrokenTR._cls_rewrite_pending
+        assert BrokenTR().rewrite_type(NamePath("f15_broken_target", "nope"), 1, 2) == 3
+
+
+class TestNamePathCache:
+    def test_resolve_cached(self):
+        cache = NamePathCache()
+        rnp = cache.resolve(NamePath("typing", "Union"))
+        assert cache.resolve(NamePath("typing", "Union")) is rnp
+
+    def test_get_namepath_cached(self):
+        cache = NamePathCache()
+        np = cache.namepath(NamePathCache)
+        assert np == NamePath("f15", "NamePathCache")
+        assert cache.namepath(NamePathCache) is np
+
+    def test_get_namepath_module_none(self):
+        ns: dict[str, Any] = {}
+        exec("def f(): pass", ns)
+        assert ns["f"].__module__ is None
+        with pytest.raises(ValueError, match="__module__ isn't a str"):
+            NamePathCache().namepath(ns["f"])
+
+    def test_get_namepath_does_not_intern(self):
+        np = NamePathCache().namepath(TestNamePathCache)
+        assert (np.module, np.qualname) not in f15._namepath_interned
+        canonical = NamePath.intern("f15", "NamePathCache")
+        assert NamePathCache().namepath(NamePathCache) is canonical
+
+    def test_bounded(self):
+        cache = NamePathCache(maxsize=2)
+        for qn in ("Union", "Optional", "Any"):
+            cache.resolve(NamePath("typing", qn))
+        assert len(cache) == 2
+        assert NamePath("typing", "Union") not in cache._fwd
+
+    def test_invalidate_on_reload_and_removal(self, tmp_path, monkeypatch):
+        (tmp_path / "npc_mod.py").write_text("class C: pass\n")
+        monkeypatch.syspath_prepend(str(tmp_path))
+        cache = NamePathCache()
+        np = NamePath("npc_mod", "C")
+        rnp = cache.resolve(np)
+        old_c = rnp.value
+        assert cache.resolve(np) is rnp
+
+        importlib.reload(rnp.module)
+        rnp2 = cache.resolve(np)
+        assert rnp2 is not rnp
+        assert rnp2.value is not old_c
+
+        del sys.modules["npc_mod"]
+        rnp3 = cache.resolve(np)
+        assert rnp3.module is not rnp2.module
+        assert rnp3.module is sys.modules["npc_mod"]
+        del sys.modules["npc_mod"]
+
+
+class TestBatchRewrite:
+    def test_rewrite_types(self):
+        from collections import Counter
+
+        items = [(np_t, (1, 2)), (np_c, (3, 4)), (np_s, (5, 6)), (np_t, (7, 8))] * 3
+        ddtr = DubDerTypeRewriter()
+        expected = [ddtr.rewrite_type(np, *args) for np, args in items]
+        counts: Counter[NamePath] = Counter()
+        assert list(ddtr.rewrite_types(iter(items), counts=counts, chunk_size=5)) == expected
+        assert counts == {
+            DubDerTypeRewriter.rewrite_method_for(np_t).self_namepath: 6,
+            DubDerTypeRewriter.rewrite_method_for(np_c).self_namepath: 3,
+            DubDerTypeRewriter.rewrite_method_for(np_s).self_namepath: 3,
+        }
+
+    def test_rewrite_types_lazy(self):
+        def gen():
+            yield (np_t, (1, 2))
+            raise RuntimeError("consumed too far")
+
+        results = TypeRewriter().rewrite_types(gen(), chunk_size=1)
+        assert next(results) == 3
+        with pytest.raises(RuntimeError):
+            next(results)
+
+    def test_rewrite_types_missing(self):
+        with pytest.raises(KeyError):
+            list(TypeRewriter().rewrite_types([(np_s, (1, 2))]))
+
+    def test_rewrite_types_miss_keeps_earlier_results(self):
+        items = [(np_t, (1, 2)), (np_c, (3, 4)), (np_s, (5, 6)), (np_t, (7, 8))]
+        results = []
+        with pytest.raises(NoRewriteMethodError) as exc_info:
+            results.extend(TypeRewriter().rewrite_types(items))
+        assert results == [3, 12]
+        assert exc_info.value.target == np_s
+
+    def test_rewrite_types_miss_stops_running(self):
+        from collections import Counter
+
+        calls = []
+
+        class SideEffectTR(GenericTypeRewriter):
+            @register_rewrite("typing", "Union")
+            def rewrite_typing_Union(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                calls.append((a, b))
+                return a + b
+
+        items = [(np_t, (1, 2)), (np_s, (5, 6)), (np_t, (7, 8)), (np_c, (3, 4))]
+        counts: Counter[NamePath] = Counter()
+        misses: Counter[NamePath] = Counter()
+        results = []
+        with pytest.raises(NoRewriteMethodError):
+            results.extend(SideEffectTR().rewrite_types(items, counts=counts, misses=misses))
+        assert results == [3]
+        assert calls == [(1, 2)]
+        assert counts == {SideEffectTR.rewrite_method_for(np_t).self_namepath: 1}
+        assert misses == {np_s: 1}
+
+    def test_rewrite_types_default(self):
+        from collections import Counter
+
+        np_x = NamePath("json", "dumps")
+        items = [(np_s, (5, 6)), (np_t, (1, 2)), (np_x, ()), (np_s, (1, 1)), (np_c, (3, 4))]
+        misses: Counter[NamePath] = Counter()
+        instr = enable_instrumentation()
+        try:
+            results = list(
+                TypeRewriter().rewrite_types(items, default=None, misses=misses, chunk_size=2)
+            )
+        finally:
+            disable_instrumentation()
+        assert results == [None, 3, None, None, 12]
+        assert misses == {np_s: 2, np_x: 1}
+        assert instr.misses == {np_s: 2, np_x: 1}
+
+
+class TestBoundMethod:
+    def test_bound_per_instance(self):
+        tr = TypeRewriter()
+        m = tr.rewrite_typing_Union
+        assert tr.rewrite_typing_Union == m
+        assert m.__self__ is tr
+        assert m(1, 2) == 3
+        assert "rewrite_typing_Union" not in vars(tr)
+        assert TypeRewriter().rewrite_typing_Union != m
+        assert TypeRewriter.rewrite_method_for(np_t).method.as_ntuple() is (
+            TypeRewriter.rewrite_method_for(np_t)
+        )
+
+    def test_shadowed_rule(self):
+        class ShadowTR(TypeRewriter):
+            @register_rewrite("construct", "Union")
+            def rewrite_typing_Union(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a - b
+
+        str_ = ShadowTR()
+        assert str_.rewrite_type(np_t, 5, 3) == 8
+        assert str_.rewrite_typing_Union(5, 3) == 2
+        assert next(str_.rewrite_types([(np_t, (5, 3))])) == 8
+        assert str_.rewrite_typing_Union(5, 3) == 2
+
+    def test_instance_collected(self):
+        import gc
+        import weakref
+
+        tr = TypeRewriter()
+        tr.rewrite_typing_Union(1, 2)
+        ref = weakref.ref(tr)
+        del tr
+        gc.collect()
+        assert ref() is None
+
+    def test_copy_rebinds(self):
+        import copy
+
+        class SelfTR(GenericTypeRewriter):
+            @register_rewrite("dataclasses", "dataclass")
+            def rewrite_dataclass(self, a: int, b: int, /, meta: AMI = AMIS) -> Any:
+                return self
+
+        tr = SelfTR()
+        assert tr.rewrite_dataclass(1, 2) is tr
+        tr2 = copy.copy(tr)
+        assert tr2.rewrite_dataclass(1, 2) is tr2
+        tr3 = copy.deepcopy(tr)
+        assert tr3.rewrite_dataclass(1, 2) is tr3
+
+    def test_pickle(self):
+        import pickle
+
+        tr = TypeRewriter()
+        assert tr.rewrite_typing_Union(1, 2) == 3
+        tr2 = pickle.loads(pickle.dumps(tr))
+        assert type(tr2) is TypeRewriter
+        assert tr2.rewrite_typing_Union(1, 2) == 3
+        assert tr2.rewrite_typing_Union.__self__ is tr2
+
+
+class TestNamePathIntern:
+    def test_intern_canonical(self):
+        a = NamePath.intern("typing", "Union")
+        assert NamePath.intern("typ" + "ing", "Union") is a
+        assert NamePath("typing", "Union") == a
+        assert hash(NamePath("typing", "Union")) == hash(a)
+        assert TypeRewriter.rewrite_method_for(np_t).namepath is a
+
+    def test_slots_and_pickle(self):
+        import pickle
+
+        a = NamePath.intern("typing", "Union")
+        assert not hasattr(a, "__dict__")
+        assert pickle.loads(pickle.dumps(a)) is a
+        assert pickle.loads(pickle.dumps(NamePath("typing", "Union"))) is a
+
+    def test_order(self):
+        assert sorted([NamePath("b", "a"), NamePath("a", "b"), NamePath("a", "a")]) == [
+            NamePath("a", "a"),
+            NamePath("a", "b"),
+            NamePath("b", "a"),
+        ]
+
+
+class TestCompiledDispatch:
+    def test_compiled_matches_generic(self):
+        class CompTR(DubDerTypeRewriter):
+            pass
+
+        class CompSubTR(CompTR):
+            @register_rewrite("construct", "Union")
+            def sub_rewrite_construct_Union(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+                return a - b
+
+        compiled = CompTR.compile_dispatch()
+        assert CompTR.rewrite_type is compiled
+        assert "rewrite_type" in vars(CompSubTR)
+        for cls in (CompTR, CompSubTR):
+            tr = cls()
+            for np in (np_t, np_c, np_s, NamePath("typing", "Union")):
+                assert tr.rewrite_type(np, 6, 4) == GenericTypeRewriter.rewrite_type(tr, np, 6, 4)
+            with pytest.raises(KeyError):
+                tr.rewrite_type(NamePath("typing", "Optional"), 1, 2)
+        assert CompSubTR().rewrite_type(np_s, 6, 4) == 2
+
+        def rewrite_optional(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+            assert meta.name == "rewrite_optional"
+            return a * 10 + b
+
+        CompTR.add_rewrite_method(
+            "rewrite_optional", register_rewrite("typing", "Optional")(rewrite_optional)
+        )
+        assert CompSubTR().rewrite_type(NamePath("typing", "Optional"), 1, 2) == 12
+        assert "rewrite_type" not in vars(DubDerTypeRewriter)
+
+    def test_compiled_large_table(self):
+        # past f15._COMPILED_INLINE_RULES rules dispatch is the table probe alone
+        def rule(self, a: int, b: int, /, meta: AMI = AMIS) -> int:
+            return int(meta.name[5:]) * 100 + a + b
+
+        nrules = f15._COMPILED_INLINE_RULES * 10
+        meths = {
+            f"rule_{i}": register_rewrite("test_compiled_large", f"T{i}")(
+                type(rule)(rule.__code__, rule.__globals__, f"rule_{i}", rule.__defaults__)
+            )
+            for i in range(nrules)
+        }
+        BigTR = type("BigTR", (TypeRewriter,), meths)
+        compiled = BigTR.compile_dispatch()
+        assert compiled.__code__.co_freevars == ("_table",)
+        tr = BigTR()
+        for i in (0, nrules // 2, nrules - 1):
+            np = NamePath("test_compiled_large", f"T{i}")
+            assert tr.rewrite_type(np, 1, 2) == i * 100 + 3
+            assert tr.rewrite_type(np, 1, 2) == GenericTypeRewriter.rewrite_type(tr, np, 1, 2)
+        with pytest.raises(KeyError):
+            tr.rewrite_type(NamePath("test_compiled_large", "missing"), 1, 2)
+
+    def test_inherited_override_kept(self):
+        class HandTR(TypeRewriter):
+            def rewrite_type(self, namepath: NamePath, a: int, b: int) -> int:
+                return -1
+
+        class HandSubTR(HandTR):
+            pass
+
+        class HandSubSubTR(HandSubTR):
+            pass
+
+        assert HandSubTR.compile_dispatch() is HandTR.rewrite_type
+        for cls in (HandTR, HandSubTR, HandSubSubTR):
+            assert "rewrite_type" not in vars(cls) or cls is HandTR
+            assert cls().rewrite_type(np_t, 1, 2) == -1
+
+
+class TestConcurrentRegistry:
+    def test_stress_define_and_dispatch(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        nthreads, nclasses = 8, 25
+        barrier = threading.Barrier(nthreads)
+
+        class SharedTR(TypeRewriter):
+            pass
+
+        def worker(tid: int) -> None:
+            barrier.wait()
+            tr = SharedTR()
+            for i in range(nclasses):
+                np = NamePath.intern(f"stress{tid}", f"T{i}")
+
+                def rule(self, a: int, b: int, /, meta: AMI = AMIS, _i: int = i) -> int:
+                    return a + b + _i
+
+                cls = type(
+                    f"StressTR_{tid}_{i}",
+                    (DubDerTypeRewriter,),
+                    {"rule": register_rewrite(np.module, np.qualname)(rule)},
+                )
+                assert cls().rewrite_type(np, 1, 2) == 3 + i
+                assert cls.rewrite_method_for(np_c).name == "dub_rewrite_c_ast_Union"
+                SharedTR.add_rewrite_method(
+                    f"shared_{tid}_{i}", register_rewrite(np.module, np.qualname)(rule)
+                )
+                assert tr.rewrite_type(np, 1, 2) == 3 + i
+                assert tr.rewrite_type(np_t, 1, 2) == 3
+
+        done = threading.Event()
+
+        def reader() -> int:
+            # lock-free iteration of the registry while it is being written to
+            n = 0
+            while not done.is_set():
+                for infos in SharedTR().registry.values():
+                    n += sum(1 for _ in infos)
+            return n
+
+        old_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=nthreads + 1) as ex:
+                rfut = ex.submit(reader)
+                try:
+                    for fut in [ex.submit(worker, t) for t in range(nthreads)]:
+                        fut.result()
+                finally:
+                    done.set()
+                assert rfut.result() > 0
+        finally:
+            sys.setswitchinterval(old_interval)
+        assert len(SharedTR.rewrite_methods()) == nthreads * nclasses
+        assert len(SharedTR.rewrite_dispatch()) == nthreads * nclasses + 2
+        assert len(SharedTR().registry[SharedTR]) == nthreads * nclasses
+
+
+class TestInstrumentation:
+    def test_hits_misses_latency(self):
+        class InstrTR(DubDerTypeRewriter):
+            pass
+
+        instr = enable_instrumentation()
+        try:
+            tr = InstrTR()
+            tr.rewrite_type(np_t, 1, 2)
+            tr.rewrite_type(np_t, 1, 2)
+            list(tr.rewrite_types([(np_c, (1, 2))]))
+            with pytest.raises(KeyError):
+                tr.rewrite_type(NamePath("typing", "Optional"), 1, 2)
+            InstrTR.compile_dispatch()
+            tr.rewrite_type(np_s, 1, 2)
+        finally:
+            assert disable_instrumentation() is instr
+        assert get_instrumentation() is None
+
+        rule_t = InstrTR.rewrite_method_for(np_t).self_namepath
+        rule_c = InstrTR.rewrite_method_for(np_c).self_namepath
+        rule_s = InstrTR.rewrite_method_for(np_s).self_namepath
+        snap = instr.snapshot()
+        assert snap["hits"] == {rule_t: 2, rule_c: 1, rule_s: 1}
+        assert snap["misses"] == {NamePath("typing", "Optional"): 1}
+        assert sum(snap["latency_ns"][rule_t].values()) == 2
+        assert snap["total_ns"][rule_t] > 0
+        assert {np for np, _, _ in instr.top(2)} <= {rule_t, rule_c, rule_s}
+
+        tr.rewrite_type(np_t, 1, 2)
+        assert instr.hits[rule_t] == 2
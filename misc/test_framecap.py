@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import gc
+import sys
+import weakref
+from types import FrameType
+
+import pytest
+from f15 import NamePath
+from framecap import (
+    FrameCapture,
+    FrameRecord,
+    TypeInterner,
+    capture_caller,
+    capture_frame,
+    capture_stack,
+    type_ids,
+)
+
+
+class Payload:
+    pass
+
+
+def callee():
+    return capture_caller()
+
+
+def caller(a, b=None, *args, key="k", **kwargs):
+    total = a + 1
+    rec = callee()
+    return rec, total
+
+
+def holds_payload(capture):
+    payload = Payload()
+    return weakref.ref(payload), capture.capture(sys._getframe())
+
+
+def typed(capture, x):
+    return capture.capture(sys._getframe())
+
+
+class TestTypeInterner:
+    def test_ids_stable(self):
+        types = TypeInterner()
+        assert types.id_for(int) == 0
+        assert types.id_for(str) == 1
+        assert types.id_for(int) == 0
+        assert types.type_for(1) is str
+        assert types.resolve([("a", 1), ("b", 0)]) == {"a": str, "b": int}
+        assert len(types) == 2
+
+
+class TestFrameCapture:
+    def test_caller_record(self):
+        rec, _ = caller(1, "b", 2.0, key=b"k", extra=None)
+        assert rec.code == NamePath(__name__, "caller")
+        assert rec.caller == NamePath(__name__, "TestFrameCapture.test_caller_record")
+        assert type_ids.resolve(rec.arg_types) == {
+            "a": int,
+            "b": str,
+            "args": tuple,
+            "key": bytes,
+            "kwargs": dict,
+        }
+        assert [name for name, _ in rec.arg_types] == ["a", "b", "key", "args", "kwargs"]
+        assert type_ids.resolve(rec.local_types) == {"total": int}
+
+    def test_records_interned(self):
+        rec1, _ = caller(1)
+        rec2, _ = caller(2)
+        rec3, _ = caller(1.0)
+        assert rec1 is rec2
+        assert rec1 is not rec3
+        assert rec1 != rec3
+
+    def test_no_frame_kept(self):
+        capture = FrameCapture()
+        ref, rec = holds_payload(capture)
+        gc.collect()
+        assert ref() is None
+        assert type_ids.resolve(rec.local_types) == {"payload": Payload}
+        assert not any(isinstance(getattr(rec, f), FrameType) for f in rec.__slots__)
+
+    def test_bounded(self):
+        capture = FrameCapture(maxsize=2)
+        for x in [1.0, "s", b"b", None, 1j]:
+            typed(capture, x)
+        assert len(capture) == 2
+        with pytest.raises(ValueError):
+            FrameCapture(maxsize=0)
+
+    def test_capture_frame(self):
+        def outer():
+            return capture_frame(sys._getframe())
+
+        rec = outer()
+        assert isinstance(rec, FrameRecord)
+        assert rec.code.qualname == "TestFrameCapture.test_capture_frame.<locals>.outer"
+        assert rec.arg_types == ()
+
+    def test_stack(self):
+        def inner():
+            return capture_stack(sys._getframe())
+
+        stack = inner()
+        assert stack[0] == NamePath(__name__, "TestFrameCapture.test_stack.<locals>.inner")
+        assert stack[1] == NamePath(__name__, "TestFrameCapture.test_stack")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    pytest.main([__file__])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import random
+
+import pytest
+from hamt import HAMT
+
+
+class Collider:
+    # equal hashes for different keys, forces collision nodes
+    def __init__(self, n: int, h: int) -> None:
+        self.n = n
+        self.h = h
+
+    def __hash__(self) -> int:
+        return self.h
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Collider) and other.n == self.n
+
+    def __repr__(self) -> str:
+        return f"Collider({self.n}, {self.h})"
+
+
+class TestHAMT:
+    @pytest.mark.parametrize("keyspace", ["ints", "strs", "colliders"])
+    def test_matches_dict(self, keyspace):
+        rng = random.Random(19)
+        keys = {
+            "ints": list(range(500)),
+            "strs": [f"k{i}" for i in range(500)],
+            "colliders": [Collider(i, i % 7) for i in range(100)],
+        }[keyspace]
+        h: HAMT = HAMT()
+        d: dict = {}
+        versions = []
+        for i in range(5000):
+            key = rng.choice(keys)
+            if rng.random() < 0.6:
+                h = h.set(key, i)
+                d[key] = i
+            elif key in d:
+                h = h.delete(key)
+                del d[key]
+            else:
+                with pytest.raises(KeyError):
+                    h.delete(key)
+            assert len(h) == len(d)
+            if i % 500 == 0:
+                versions.append((h, dict(d)))
+        assert dict(h.iter_items()) == d
+        assert set(h) == set(d)
+        for k in keys:
+            assert (k in h) == (k in d)
+            assert h.get(k, None) == d.get(k, None)
+        # older versions are untouched by later updates
+        for old, expected in versions:
+            assert dict(old.iter_items()) == expected
+
+    def test_delete_to_empty(self):
+        h = HAMT((i, i) for i in range(100))
+        for i in range(100):
+            h = h.delete(i)
+        assert len(h) == 0
+        assert list(h) == []
+        assert h.set(1, 2)[1] == 2
+
+    def test_set_same_value_shares(self):
+        value = object()
+        h = HAMT({1: value})
+        assert h.set(1, value) is h
+        assert h.update({1: value}) is h
+
+
+if __name__ == "__main__":  # pragma: no cover
+    pytest.main([__file__])
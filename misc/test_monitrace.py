@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import gc
+import sys
+import typing
+
+import pytest
+from monkeytype.tracing import CallTrace, CallTraceLogger
+
+if sys.version_info < (3, 12):
+    pytest.skip("sys.monitoring requires Python 3.12+", allow_module_level=True)
+
+import monitrace
+from monitrace import MonitoringCallTracer, SamplingPolicy, trace_calls_monitoring
+
+
+class ListLogger(CallTraceLogger):
+    def __init__(self) -> None:
+        self.traces: list[CallTrace] = []
+        self.flushed = 0
+
+    def log(self, trace: CallTrace) -> None:
+        self.traces.append(trace)
+
+    def flush(self) -> None:
+        self.flushed += 1
+
+
+def add(a, b):
+    return a + b
+
+
+def gen(n):
+    yield from range(n)
+    return "done"
+
+
+def boom(x):
+    raise ValueError(x)
+
+
+class Calc:
+    def mul(self, a, b):
+        return a * b
+
+
+class TestMonitoringTracer:
+    def test_records_selected_module(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__]):
+            add(1, 2)
+            add("a", "b")
+            Calc().mul(2.0, 3)
+            typing.get_origin(list[int])
+        assert logger.traces == [
+            CallTrace(add, {"a": int, "b": int}, int),
+            CallTrace(add, {"a": str, "b": str}, str),
+            CallTrace(Calc.mul, {"self": Calc, "a": float, "b": int}, float),
+        ]
+        assert logger.flushed == 1
+
+    def test_generator_and_exception(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__]):
+            assert list(gen(2)) == [0, 1]
+            with pytest.raises(ValueError):
+                boom(1)
+        assert logger.traces == [
+            CallTrace(gen, {"n": int}, str, int),
+            CallTrace(boom, {"x": int}),
+        ]
+
+    def test_unselected_module_disabled(self, monkeypatch):
+        logger = ListLogger()
+        checked = []
+        tracer = MonitoringCallTracer(logger, 0, ["no_such_module"])
+        is_selected = tracer._is_selected_module
+        monkeypatch.setattr(
+            tracer, "_is_selected_module", lambda m: checked.append(m) or is_selected(m)
+        )
+        tracer.start()
+        try:
+            for _ in range(3):
+                add(1, 2)
+        finally:
+            tracer.stop()
+        assert logger.traces == []
+        # looked up once then DISABLEd, not re-examined per call, and not remembered either
+        assert checked.count(__name__) == 1
+        assert not tracer._funcs
+
+    def test_entries_dropped_with_their_code(self):
+        ns: dict[str, typing.Any] = {"__name__": __name__}
+        exec("def tmp(x):\n    return x\n", ns)
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__]) as tracer:
+            ns["tmp"](1)
+            assert len(tracer._funcs) == 1
+            # the logged trace holds the function too
+            logger.traces.clear()
+            ns.clear()
+            gc.collect()
+            assert not tracer._funcs
+
+    def test_restart_after_stop(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, ["no_such_module"]):
+            add(1, 2)
+        with trace_calls_monitoring(logger, 0, [__name__]):
+            add(1, 2)
+        assert logger.traces == [CallTrace(add, {"a": int, "b": int}, int)]
+
+    def test_double_start(self):
+        tracer = MonitoringCallTracer(ListLogger(), 0, [__name__])
+        tracer.start()
+        try:
+            with pytest.raises(RuntimeError):
+                tracer.start()
+        finally:
+            tracer.stop()
+        assert monitrace.HAVE_MONITORING
+
+
+class TestSampling:
+    policy = SamplingPolicy(quiet_calls=5, max_interval=8, wake_interval=0)
+
+    def _sampler(self, tracer, func):
+        return tracer._funcs[id(func.__code__)][2]
+
+    def _add_traces(self, logger):
+        # the test methods are in the traced module too
+        return [trace for trace in logger.traces if trace.func is add]
+
+    def test_backoff_then_park(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__], sampling=self.policy) as tracer:
+            for _ in range(10_000):
+                add(1, 2)
+            sampler = self._sampler(tracer, add)
+            assert sampler.parked
+            assert tracer._nparked == 1
+        # 1 new + 5 quiet calls at each interval of 1, 2, 4 and 8
+        assert len(self._add_traces(logger)) == 21
+        assert set(self._add_traces(logger)) == {CallTrace(add, {"a": int, "b": int}, int)}
+
+    def test_new_signature_resets(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__], sampling=self.policy) as tracer:
+            for _ in range(1000):
+                add(1, 2)
+            sampler = self._sampler(tracer, add)
+            assert sampler.parked
+            # parked code is only looked at again once woken
+            add("a", "b")
+            assert len(self._add_traces(logger)) == 21
+            tracer.wake()
+            add("a", "b")
+            assert not sampler.parked
+            assert sampler.interval == 1
+            add(1.0, 2.0)
+            assert tracer._nparked == 0
+        assert self._add_traces(logger)[-2:] == [
+            CallTrace(add, {"a": str, "b": str}, str),
+            CallTrace(add, {"a": float, "b": float}, float),
+        ]
+
+    def test_parked_wake_samples_once(self):
+        logger = ListLogger()
+        with trace_calls_monitoring(logger, 0, [__name__], sampling=self.policy) as tracer:
+            for _ in range(1000):
+                add(1, 2)
+            ntraces = len(self._add_traces(logger))
+            tracer.wake()
+            for _ in range(1000):
+                add(1, 2)
+            assert len(self._add_traces(logger)) == ntraces + 1
+            assert self._sampler(tracer, add).parked
+
+    def test_policy_validation(self):
+        with pytest.raises(ValueError):
+            SamplingPolicy(quiet_calls=0)
+        with pytest.raises(ValueError):
+            SamplingPolicy(wake_interval=-1)
+
+    def test_no_waker_by_default(self):
+        tracer = MonitoringCallTracer(ListLogger(), 0, [__name__], sampling=SamplingPolicy())
+        tracer.start()
+        try:
+            assert tracer._waker is None
+        finally:
+            tracer.stop()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    pytest.main([__file__])
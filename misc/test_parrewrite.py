@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import importlib
+import multiprocessing
+import sys
+import typing
+
+import pytest
+from f15 import register_rewrite
+from parrewrite import rewrite_corpus
+from typetree import OptionalTreeRewriter, TypeNode, TypeTreeRewriter
+
+DYNAMIC_RULES_SRC = """
+from f15 import AMIS
+from typetree import TypeNode, TypeTreeRewriter
+
+
+class DynamicTR(TypeTreeRewriter):
+    pass
+
+
+def rewrite_str(self, node, /, meta=AMIS):
+    return TypeNode.from_annotation(int)
+"""
+
+
+def make_corpus(nmods: int) -> list[tuple[str, list[typing.Any]]]:
+    return [
+        (
+            f"mod{i}",
+            [typing.Union[int, None], dict[str, list[int] | None], tuple[int, ...]][: i % 3 + 1],
+        )
+        for i in range(nmods)
+    ]
+
+
+class TestRewriteCorpus:
+    @pytest.mark.parametrize("start_method", ["fork", "spawn"])
+    def test_matches_serial_in_order(self, start_method):
+        corpus = make_corpus(12)
+        otr = OptionalTreeRewriter()
+        expected = [
+            (mod, [otr.rewrite_tree(TypeNode.from_annotation(a)) for a in anns])
+            for mod, anns in corpus
+        ]
+        results = list(
+            rewrite_corpus(
+                OptionalTreeRewriter,
+                iter(corpus),
+                max_workers=2,
+                window=3,
+                mp_context=multiprocessing.get_context(start_method),
+            )
+        )
+        assert results == expected
+        # unpickled nodes are re-interned, so identity holds across the process boundary
+        assert all(r is e for (_, rs), (_, es) in zip(results, expected) for r, e in zip(rs, es))
+
+    def test_local_class_rejected(self):
+        class LocalTR(TypeTreeRewriter):
+            pass
+
+        with pytest.raises(ValueError):
+            list(rewrite_corpus(LocalTR, make_corpus(1)))
+
+    @pytest.mark.parametrize("window", [0, -1])
+    def test_bad_window_rejected(self, window):
+        with pytest.raises(ValueError, match="window must be positive"):
+            list(rewrite_corpus(OptionalTreeRewriter, make_corpus(1), window=window))
+
+    @pytest.fixture
+    def dynamic_rules(self, tmp_path, monkeypatch):
+        (tmp_path / "parrewrite_dynamic_rules.py").write_text(DYNAMIC_RULES_SRC)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        sys.modules.pop("parrewrite_dynamic_rules", None)
+        yield importlib.import_module("parrewrite_dynamic_rules")
+        sys.modules.pop("parrewrite_dynamic_rules", None)
+
+    @pytest.mark.parametrize("start_method", ["fork", "spawn"])
+    def test_runtime_rules_sent_to_workers(self, start_method, dynamic_rules):
+        dynamic_rules.DynamicTR.add_rewrite_method(
+            "rewrite_str", register_rewrite("builtins", "str")(dynamic_rules.rewrite_str)
+        )
+        results = list(
+            rewrite_corpus(
+                dynamic_rules.DynamicTR,
+                [("mod0", [str, list[str]])],
+                max_workers=1,
+                mp_context=multiprocessing.get_context(start_method),
+            )
+        )
+        assert [n.to_annotation() for n in results[0][1]] == [int, list[int]]
+
+    def test_local_runtime_rule_rejected(self, dynamic_rules):
+        def rewrite_str(self, node, /, meta=None):
+            return node
+
+        dynamic_rules.DynamicTR.add_rewrite_method(
+            "rewrite_str", register_rewrite("builtins", "str")(rewrite_str)
+        )
+        with pytest.raises(ValueError, match="module level function"):
+            list(rewrite_corpus(dynamic_rules.DynamicTR, make_corpus(1)))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import threading
+import time
+
+import pytest
+from monkeytype.db.sqlite import DEFAULT_TABLE, SQLiteStore
+from monkeytype.tracing import CallTrace
+from tracewriter import BatchingTraceWriter
+
+
+def add(a, b):
+    return a + b
+
+
+def sub(a, b):
+    return a - b
+
+
+TYPES = [int, str, bytes, float, complex, bool, list, dict]
+
+
+def make_traces(n):
+    return [CallTrace(add, {"a": TYPES[i % len(TYPES)], "b": int}, int) for i in range(n)]
+
+
+def count_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {DEFAULT_TABLE}").fetchone()[0]
+
+
+def wait_drained(writer):
+    deadline = time.monotonic() + 5
+    while len(writer) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert not len(writer)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "traces.sqlite3")
+
+
+def stall(path):
+    # holds the database's write lock so the writer thread blocks inside its next insert
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("BEGIN EXCLUSIVE")
+    return conn
+
+
+class TestBatchingTraceWriter:
+    def test_roundtrip(self, db):
+        traces = make_traces(100)
+        with BatchingTraceWriter(db, batch_size=16) as writer:
+            for trace in traces:
+                writer.log(trace)
+            writer.flush()
+            assert count_rows(db) == 100
+            assert writer.written == 100
+        store = SQLiteStore(sqlite3.connect(db))
+        stored = [thunk.to_trace() for thunk in store.filter(__name__, limit=1000)]
+        assert sorted(stored, key=repr) == sorted(set(traces), key=repr)
+
+        # rows from an older SQLiteStore session sort behind the writer's under a limit
+        old = [CallTrace(sub, {"a": t, "b": int}, int) for t in TYPES]
+        with sqlite3.connect(db) as conn:
+            conn.execute(f"DELETE FROM {DEFAULT_TABLE}")
+            SQLiteStore(conn).add(old)
+            conn.execute(f"UPDATE {DEFAULT_TABLE} SET created_at = datetime(created_at, '-1 day')")
+        with BatchingTraceWriter(db) as writer:
+            for trace in traces:
+                writer.log(trace)
+        with sqlite3.connect(db) as conn:
+            dates = conn.execute(f"SELECT DISTINCT date(created_at) FROM {DEFAULT_TABLE}")
+            assert None not in {date for (date,) in dates}
+        stored = [thunk.to_trace() for thunk in store.filter(__name__, limit=len(TYPES))]
+        assert sorted(stored, key=repr) == sorted(set(traces), key=repr)
+        assert len(store.filter(__name__, limit=1000)) == 2 * len(TYPES)
+
+    def test_interval_flush(self, db):
+        with BatchingTraceWriter(db, batch_size=1000, flush_interval=0.01) as writer:
+            writer.log(make_traces(1)[0])
+            wait_drained(writer)
+            deadline = time.monotonic() + 5
+            while writer.written < 1 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            assert writer.written == 1
+
+    def test_close_flushes(self, db):
+        writer = BatchingTraceWriter(db, batch_size=1000, flush_interval=60)
+        for trace in make_traces(10):
+            writer.log(trace)
+        writer.close()
+        assert count_rows(db) == 10
+        writer.close()
+        writer.log(make_traces(1)[0])
+        assert writer.dropped == 1
+
+    def test_drop(self, db):
+        with BatchingTraceWriter(db, maxsize=10, batch_size=10, flush_interval=60) as writer:
+            lock = stall(db)
+            for trace in make_traces(10):
+                writer.log(trace)
+            wait_drained(writer)
+            for trace in make_traces(15):
+                writer.log(trace)
+            assert writer.dropped == 5
+            assert len(writer) == 10
+            lock.execute("COMMIT")
+            writer.flush()
+            assert writer.written == 20
+        assert count_rows(db) == 20
+
+    def test_sample(self, db):
+        with BatchingTraceWriter(
+            db, maxsize=10, batch_size=10, when_full="sample", sample_every=4, flush_interval=60
+        ) as writer:
+            lock = stall(db)
+            for trace in make_traces(10):
+                writer.log(trace)
+            wait_drained(writer)
+            traces = make_traces(20)
+            for trace in traces:
+                writer.log(trace)
+            # every 4th trace past the first 10 replaced the oldest queued one
+            assert writer.dropped == 10
+            assert [trace for _, trace in writer._queue][-2:] == [traces[13], traces[17]]
+            lock.execute("COMMIT")
+            writer.flush()
+            assert writer.written == 20
+
+    def test_block(self, db):
+        with BatchingTraceWriter(db, maxsize=4, batch_size=4, when_full="block") as writer:
+            for trace in make_traces(200):
+                writer.log(trace)
+            writer.flush()
+            assert writer.dropped == 0
+            assert writer.written == 200
+
+    def test_unencodable(self, db):
+        with BatchingTraceWriter(db) as writer:
+            writer.log(CallTrace(add, {"a": object(), "b": int}, int))
+            writer.log(make_traces(1)[0])
+            writer.flush()
+            assert writer.failed == 1
+            assert writer.written == 1
+            assert isinstance(writer.last_error, AttributeError)
+
+    def test_validation(self, db):
+        with pytest.raises(ValueError):
+            BatchingTraceWriter(db, maxsize=0)
+        with pytest.raises(ValueError):
+            BatchingTraceWriter(db, when_full="spill")  # type: ignore
+        for interval in (0, -1.0):
+            with pytest.raises(ValueError):
+                BatchingTraceWriter(db, flush_interval=interval)
+
+    @pytest.mark.parametrize("when_full", ["drop", "block"])
+    def test_thread_dies(self, db, monkeypatch, when_full):
+        connect = sqlite3.connect
+
+        def main_thread_connect(*args, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                raise sqlite3.OperationalError("unable to open database file")
+            return connect(*args, **kwargs)
+
+        monkeypatch.setattr(sqlite3, "connect", main_thread_connect)
+        with BatchingTraceWriter(db, maxsize=2, batch_size=2, when_full=when_full) as writer:
+            # neither a full queue nor flush() waits on the dead thread
+            for trace in make_traces(10):
+                writer.log(trace)
+            with pytest.raises(RuntimeError) as excinfo:
+                writer.flush()
+            assert isinstance(excinfo.value.__cause__, sqlite3.OperationalError)
+            assert writer.fatal_error is excinfo.value.__cause__
+            assert writer.written == 0
+            assert writer.dropped + writer.failed == 10
+            assert not len(writer)
+            writer.log(make_traces(1)[0])
+            assert writer.dropped + writer.failed == 11
+
+
+if __name__ == "__main__":  # pragma: no cover
+    pytest.main([__file__])
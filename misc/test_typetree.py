@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# ruff: noqa: UP006, UP035
+
+import pickle
+import typing
+from collections.abc import Callable
+from typing import Annotated, Dict, List, Literal, Optional, Tuple, Union
+
+import pytest
+from f15 import AMI, AMIS, register_rewrite
+from typetree import OptionalTreeRewriter, TypeNode, TypeTreeRewriter
+
+
+class TestTypeNode:
+    def test_hash_consed(self):
+        a = TypeNode.from_annotation(Dict[str, Tuple[int, ...]])
+        b = TypeNode.from_annotation(dict[str, tuple[int, ...]])
+        assert a is b
+        assert TypeNode.from_annotation(List[Dict[str, Tuple[int, ...]]]).args[0] is a
+        assert TypeNode.from_annotation(Literal[1]) is not TypeNode.from_annotation(Literal[True])
+
+    @pytest.mark.parametrize(
+        "ann",
+        [
+            int,
+            None,
+            Optional[list[dict[str, tuple[int, ...]]]],
+            int | str | None,
+            Callable[[int, str], bool],
+            Literal[1, "a"],
+            Annotated[int, {"unhashable": []}],
+            typing.Any,
+        ],
+    )
+    def test_round_trip(self, ann):
+        assert TypeNode.from_annotation(ann).to_annotation() == ann
+
+    def test_typing_aliases_normalized(self):
+        ann = TypeNode.from_annotation(Optional[List[Dict[str, Tuple[int, ...]]]]).to_annotation()
+        assert ann == Optional[list[dict[str, tuple[int, ...]]]]
+
+    def test_pickle_reinterns(self):
+        node = TypeNode.from_annotation(Union[List[Dict[str, Tuple[int, ...]]], None])
+        assert pickle.loads(pickle.dumps(node)) is node
+
+    def test_local_types_kept_by_object(self):
+        def make():
+            class Local:
+                pass
+
+            class LocalGeneric(typing.Generic[typing.T]):
+                pass
+
+            return Local, LocalGeneric
+
+        local_a, generic_a = make()
+        local_b, _ = make()
+        node_a = TypeNode.from_annotation(local_a)
+        assert node_a.literal is local_a
+        assert TypeNode.from_annotation(local_b) is not node_a
+        assert TypeNode.from_annotation(Optional[local_a]).to_annotation() == Optional[local_a]
+        assert TypeNode.from_annotation(generic_a[int]).to_annotation() == generic_a[int]
+
+
+class TestTypeTreeRewriter:
+    def test_local_type_rewrite(self):
+        def make():
+            class Local:
+                pass
+
+            return Local
+
+        local_a, local_b = make(), make()
+        otr = OptionalTreeRewriter()
+        assert otr.rewrite_annotation(Union[local_a, None]) == Optional[local_a]
+        assert otr.rewrite_annotation(Union[local_b, None]) == Optional[local_b]
+
+    def test_optional_rewrite(self):
+        otr = OptionalTreeRewriter()
+        assert otr.rewrite_annotation(Union[List[int], None]) == Optional[list[int]]
+        assert otr.rewrite_annotation(dict[str, int | None]) == dict[str, Optional[int]]
+        assert otr.rewrite_annotation(Union[int, str, None]) == Union[int, str, None]
+
+    def test_memoized_per_distinct_subtree(self):
+        calls: list[TypeNode] = []
+
+        class CountingTR(TypeTreeRewriter):
+            @register_rewrite("builtins", "list")
+            def rewrite_list(self, node: TypeNode, /, meta: AMI = AMIS) -> TypeNode:
+                calls.append(node)
+                return node
+
+        inner = List[Dict[str, Tuple[int, ...]]]
+        corpus = [Union[inner, None], Tuple[inner, inner], inner, List[inner]] * 100
+        ctr = CountingTR()
+        for ann in corpus:
+            ctr.rewrite_tree(TypeNode.from_annotation(ann))
+        distinct = {n for ann in corpus for n in TypeNode.from_annotation(ann).walk()}
+        assert ctr.memo_size == len(distinct)
+        # inner and List[inner]
+        assert len(calls) == 2
+
+    def test_memo_reset_on_new_rule(self):
+        class LateTR(TypeTreeRewriter):
+            pass
+
+        ltr = LateTR()
+        node = TypeNode.from_annotation(List[int])
+        assert ltr.rewrite_tree(node) is node
+
+        def rewrite_list(self, node: TypeNode, /, meta: AMI = AMIS) -> TypeNode:
+            return TypeNode.from_annotation(Tuple[int, ...])
+
+        LateTR.add_rewrite_method(
+            "rewrite_list", register_rewrite("builtins", "list")(rewrite_list)
+        )
+        assert ltr.rewrite_annotation(List[int]) == tuple[int, ...]
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import atexit
+import datetime
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Literal
+
+from monkeytype.db.sqlite import DEFAULT_TABLE, create_call_trace_table
+from monkeytype.encoding import CallTraceRow
+from monkeytype.tracing import CallTrace, CallTraceLogger
+
+# What log() does with a trace when the queue is full:
+#   drop   - throw the new trace away
+#   block  - wait for the writer to make room
+#   sample - keep every sample_every'th new trace by evicting the oldest queued one, drop the rest
+QueueFullPolicy = Literal["drop", "block", "sample"]
+QUEUE_FULL_POLICIES: tuple[QueueFullPolicy, ...] = ("drop", "block", "sample")
+
+
+# MonkeyType's CallTraceStoreLogger buffers traces until flush() and then serializes and inserts
+# them in the calling thread, so the traced code pays for type_to_json() and SQLite I/O. This
+# logger only timestamps the trace and appends it to a bounded queue. A background thread owns
+# the SQLite connection, serializes traces and inserts them batch_size at a time with
+# executemany(), one transaction per batch, into MonkeyType's call trace table.
+class BatchingTraceWriter(CallTraceLogger):
+    database: str
+    table: str
+    maxsize: int
+    batch_size: int
+    when_full: QueueFullPolicy
+    sample_every: int
+    flush_interval: float
+    # traces dropped because the queue was full, traces that failed to serialize or insert
+    dropped: int
+    failed: int
+    written: int
+    last_error: BaseException | None
+    # what stopped the writer thread, once set nothing more is written and log() drops traces
+    fatal_error: BaseException | None
+    _queue: deque[tuple[datetime.datetime, CallTrace]]
+    _cond: threading.Condition
+    # traces accepted into the queue and traces done with (written, failed or evicted), flush()
+    # waits for the latter to catch up with the former
+    _accepted: int
+    _done: int
+    _full_seen: int
+    _batch_ready: int
+    _flushing: int
+    _closing: bool
+    _thread: threading.Thread | None
+
+    def __init__(
+        self,
+        database: str,
+        table: str = DEFAULT_TABLE,
+        maxsize: int = 65536,
+        batch_size: int = 4096,
+        when_full: QueueFullPolicy = "drop",
+        sample_every: int = 16,
+        flush_interval: float = 1.0,
+    ) -> None:
+        if maxsize <= 0 or batch_size <= 0 or sample_every <= 0:
+            raise ValueError(
+                "BatchingTraceWriter sizes must be positive, got: "
+                f"maxsize={maxsize} batch_size={batch_size} sample_every={sample_every}"
+            )
+        if flush_interval <= 0:
+            raise ValueError(
+                f"BatchingTraceWriter flush_interval must be positive, got: {flush_interval}"
+            )
+        if when_full not in QUEUE_FULL_POLICIES:
+            raise ValueError(
+                f"BatchingTraceWriter when_full must be one of {QUEUE_FULL_POLICIES}, "
+                f"got: {when_full!r}"
+            )
+        # the writer thread opens its own connection, so ":memory:" would be a different database
+        self.database = database
+        self.table = table
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.when_full = when_full
+        self.sample_every = sample_every
+        self.flush_interval = flush_interval
+        # a full queue counts as a full batch, otherwise block would wait out flush_interval
+        self._batch_ready = min(batch_size, maxsize)
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self.last_error = None
+        self.fatal_error = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._accepted = 0
+        self._done = 0
+        self._full_seen = 0
+        self._flushing = 0
+        self._closing = False
+        # the table is created here so a bad database fails in the caller rather than the thread
+        conn = sqlite3.connect(database)
+        try:
+            create_call_trace_table(conn, table)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name="tracewriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> BatchingTraceWriter:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def log(self, trace: CallTrace) -> None:
+        # same created_at as SQLiteStore.add(), MonkeyType's queries order by date(created_at)
+        item = (datetime.datetime.now(), trace)
+        with self._cond:
+            queue = self._queue
+            if self._closing or self.fatal_error is not None:
+                self.dropped += 1
+                return
+            if len(queue) >= self.maxsize:
+                if self.when_full == "drop":
+                    self.dropped += 1
+                    return
+                if self.when_full == "block":
+                    while (
+                        len(queue) >= self.maxsize
+                        and not self._closing
+                        and self.fatal_error is None
+                    ):
+                        self._cond.wait()
+                    if self._closing or self.fatal_error is not None:
+                        self.dropped += 1
+                        return
+                else:
+                    self._full_seen += 1
+                    self.dropped += 1
+                    if self._full_seen % self.sample_every:
+                        return
+                    queue.popleft()
+                    self._done += 1
+            queue.append(item)
+            self._accepted += 1
+            if len(queue) == self._batch_ready:
+                self._cond.notify_all()
+
+    def flush(self) -> None:
+        # wait until everything logged so far has been written, raises if the writer thread died
+        with self._cond:
+            if self._thread is not None:
+                target = self._accepted
+                self._flushing += 1
+                self._cond.notify_all()
+                try:
+                    while self._done < target and self.fatal_error is None:
+                        self._cond.wait()
+                finally:
+                    self._flushing -= 1
+            if self.fatal_error is not None:
+                raise RuntimeError("BatchingTraceWriter thread died") from self.fatal_error
+
+    def close(self) -> None:
+        # flushes, then stops the writer thread, safe to call more than once
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        thread.join()
+        self._thread = None
+        atexit.unregister(self.close)
+
+    def _take(self) -> list[tuple[datetime.datetime, CallTrace]] | None:
+        # next batch for the writer thread, waits for a full batch, a flush or flush_interval to
+        # pass with something queued. None once closed and drained.
+        with self._cond:
+            queue = self._queue
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closing:
+                if queue and (len(queue) >= self._batch_ready or self._flushing):
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    if queue:
+                        break
+                    deadline = time.monotonic() + self.flush_interval
+                    timeout = self.flush_interval
+                self._cond.wait(timeout)
+            if not queue:
+                return None
+            n = min(len(queue), self.batch_size)
+            batch = [queue.popleft() for _ in range(n)]
+            # producers blocked on a full queue have room now
+            self._cond.notify_all()
+            return batch
+
+    def _rows(self, batch: list[tuple[datetime.datetime, CallTrace]]) -> list[tuple[Any, ...]]:
+        rows = []
+        for created_at, trace in batch:
+            try:
+                row = CallTraceRow.from_trace(trace)
+            except Exception as e:
+                # same as monkeytype.encoding.serialize_traces(), unencodable types are skipped
+                self.last_error = e
+                continue
+            rows.append((
+                # the text sqlite3's default datetime adapter (deprecated since 3.12) stores
+                created_at.isoformat(" "),
+                row.module,
+                row.qualname,
+                row.arg_types,
+                row.return_type,
+                row.yield_type,
+            ))
+        return rows
+
+    def _run(self) -> None:
+        try:
+            self._write()
+        except Exception as e:
+            # nothing queued or in flight will be written now, count it as failed so flush() and
+            # producers blocked on a full queue wake up instead of waiting for the thread forever
+            with self._cond:
+                self.last_error = self.fatal_error = e
+                self.failed += self._accepted - self._done
+                self._done = self._accepted
+                self._queue.clear()
+                self._cond.notify_all()
+
+    def _write(self) -> None:
+        # sqlite3 connections can't be shared across threads, this one lives and dies here
+        conn = sqlite3.connect(self.database)
+        query = f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)"
+        try:
+            while (batch := self._take()) is not None:
+                rows = self._rows(batch)
+                nwritten = 0
+                try:
+                    with conn:
+                        conn.executemany(query, rows)
+                    nwritten = len(rows)
+                except Exception as e:
+                    # a failed batch is counted, it doesn't take the writer (and flush()) down
+                    self.last_error = e
+                with self._cond:
+                    self.written += nwritten
+                    self.failed += len(batch) - nwritten
+                    self._done += len(batch)
+                    self._cond.notify_all()
+        finally:
+            conn.close()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import functools
+import operator
+import types
+import typing
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, ClassVar
+
+from f15 import (
+    AMI,
+    AMIS,
+    AnnotatedMethodInfo,
+    GenericTypeRewriter,
+    NamePath,
+    get_namepath,
+    register_rewrite,
+    resolve_namepath,
+)
+
+if not TYPE_CHECKING:
+    try:
+        from rich import print
+    except ImportError:
+        pass
+
+
+class _NoLiteral:
+    def __repr__(self) -> str:
+        return "NO_LITERAL"
+
+    def __reduce__(self) -> str:
+        return "NO_LITERAL"
+
+
+NO_LITERAL: Any = _NoLiteral()
+
+NP_NONE = NamePath.intern("builtins", "NoneType")
+# pseudo head for the [int, str] parameter list of Callable, not a real importable name
+NP_PARAMS = NamePath.intern("<typetree>", "params")
+NP_UNIONTYPE = NamePath.intern("types", "UnionType")
+
+
+# Hash-consed type tree node: structurally equal trees are the same object, built through
+# TypeNode.intern() only. Equality and hashing are therefore by identity (eq=False) and a node can
+# be used as a memo key at the cost of a pointer hash. Leaves that aren't types (Literal values,
+# Annotated metadata, Ellipsis, None) keep the value in literal with head the NamePath of its type.
+# A type (or generic origin) that can't be re-imported by name, e.g. a class defined in a function,
+# keeps the object itself in literal with head its own NamePath, so it is interned on the object.
+@dataclass(frozen=True, eq=False, slots=True)
+class TypeNode:
+    head: NamePath
+    args: tuple[TypeNode, ...] = ()
+    literal: Any = NO_LITERAL
+    size: int = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "size", 1 + sum(a.size for a in self.args))
+
+    def __reduce__(self) -> tuple[Callable[..., TypeNode], tuple[Any, ...]]:
+        return TypeNode.intern, (self.head, self.args, self.literal)
+
+    @classmethod
+    def intern(
+        cls, head: NamePath, args: tuple[TypeNode, ...] = (), literal: Any = NO_LITERAL
+    ) -> TypeNode:
+        # type(literal) so that 1, 1.0 and True don't collapse into one node
+        key: tuple[Any, ...] = (head, args, type(literal), literal)
+        try:
+            node = _typenode_interned.get(key, None)
+        except TypeError:
+            # unhashable Annotated metadata, fall back to its identity (the node keeps it alive)
+            key = (head, args, type(literal), id(literal))
+            node = _typenode_interned.get(key, None)
+        if node is None:
+            node = _typenode_interned.setdefault(key, cls(head, args, literal))
+        return node
+
+    @classmethod
+    def from_annotation(cls, ann: Any) -> TypeNode:
+        # keyed by identity, typing caches its generic aliases so repeated annotations are the
+        # same object (and Union.__eq__ ignores argument order, which we must not)
+        ent = _from_annotation_cache.get(id(ann), None)
+        if ent is not None and ent[0] is ann:
+            return ent[1]
+        node = cls._from_annotation(ann)
+        while len(_from_annotation_cache) >= FROM_ANNOTATION_CACHE_SIZE:
+            _from_annotation_cache.pop(next(iter(_from_annotation_cache)), None)
+        _from_annotation_cache[id(ann)] = (ann, node)
+        return node
+
+    @classmethod
+    def _from_annotation(cls, ann: Any) -> TypeNode:
+        if ann is None or ann is types.NoneType:
+            return cls.intern(NP_NONE, (), None)
+        if isinstance(ann, list):
+            return cls.intern(NP_PARAMS, tuple(cls.from_annotation(a) for a in ann))
+        origin = typing.get_origin(ann)
+        if origin is not None:
+            args = tuple(cls.from_annotation(a) for a in typing.get_args(ann))
+            head, literal = _type_head(origin)
+            return cls.intern(head, args, literal)
+        if isinstance(ann, type) or ann.__class__ is typing._SpecialForm:
+            head, literal = _type_head(ann)
+            return cls.intern(head, (), literal)
+        return cls.intern(get_namepath(type(ann)), (), ann)
+
+    def to_annotation(self) -> Any:
+        if self.head is NP_PARAMS:
+            return [a.to_annotation() for a in self.args]
+        args = tuple(a.to_annotation() for a in self.args)
+        if self.head is NP_UNIONTYPE:
+            return functools.reduce(operator.or_, args)
+        if self.literal is not NO_LITERAL:
+            val = self.literal
+        else:
+            val = resolve_namepath(self.head).value
+        if not args:
+            return val
+        return val[args if len(args) > 1 else args[0]]
+
+    def walk(self) -> Iterator[TypeNode]:
+        yield self
+        for a in self.args:
+            yield from a.walk()
+
+
+def _type_head(val: Any) -> tuple[NamePath, Any]:
+    # (head, literal) for a type or generic origin, see TypeNode
+    np = get_namepath(val)
+    if "<locals>" not in np.qualname:
+        try:
+            if resolve_namepath(np).value is val:
+                return np, NO_LITERAL
+        except (ImportError, AttributeError):
+            pass
+    return np, val
+
+
+_typenode_interned: dict[tuple[Any, ...], TypeNode] = {}
+FROM_ANNOTATION_CACHE_SIZE = 65536
+_from_annotation_cache: dict[int, tuple[Any, TypeNode]] = {}
+
+_MISSING: Any = object()
+
+
+# Tree-walking engine on top of GenericTypeRewriter. Children are rewritten first, then the rule
+# registered for the node's head (if any) is called with the node rebuilt from the rewritten
+# children and must return a TypeNode. Results are memoized per unique (hash-consed) subtree, so
+# a corpus costs about one rule dispatch per distinct subtree however often it repeats.
+class TypeTreeRewriter(GenericTypeRewriter):
+    _memo: dict[TypeNode, TypeNode]
+    _memo_dispatch: dict[NamePath, AnnotatedMethodInfo] | None
+
+    def __init__(self) -> None:
+        self._memo = {}
+        self._memo_dispatch = None
+
+    def rewrite_tree(self, node: TypeNode) -> TypeNode:
+        dispatch = type(self)._cls_rewrite_dispatch
+        if dispatch is not self._memo_dispatch:
+            # rules were added since the memo was filled
+            self._memo = {}
+            self._memo_dispatch = dispatch
+        return self._rewrite_tree(node, dispatch)
+
+    def _rewrite_tree(
+        self, node: TypeNode, dispatch: dict[NamePath, AnnotatedMethodInfo]
+    ) -> TypeNode:
+        res = self._memo.get(node, _MISSING)
+        if res is not _MISSING:
+            return res
+        args = tuple(self._rewrite_tree(a, dispatch) for a in node.args)
+        res = node
+        if args != node.args:
+            res = TypeNode.intern(node.head, args, node.literal)
+        rewriter = dispatch.get(node.head, None)
+        if rewriter is not None:
+            res = self._call_annotated_method(rewriter, res)
+        self._memo[node] = res
+        return res
+
+    def rewrite_annotation(self, ann: Any) -> Any:
+        return self.rewrite_tree(TypeNode.from_annotation(ann)).to_annotation()
+
+    def rewrite_trees(self, nodes: Iterable[TypeNode]) -> Iterator[TypeNode]:
+        for node in nodes:
+            yield self.rewrite_tree(node)
+
+    @property
+    def memo_size(self) -> int:
+        return len(self._memo)
+
+
+class OptionalTreeRewriter(TypeTreeRewriter):
+    NP_UNION: ClassVar[NamePath] = NamePath.intern("typing", "Union")
+    NP_OPTIONAL: ClassVar[NamePath] = NamePath.intern("typing", "Optional")
+
+    # Union[X, None] -> Optional[X]
+    @register_rewrite("typing", "Union")
+    def rewrite_typing_Union(self, node: TypeNode, /, meta: AMI = AMIS) -> TypeNode:
+        if len(node.args) == 2 and node.args[1].head is NP_NONE:
+            return TypeNode.intern(self.NP_OPTIONAL, node.args[:1])
+        return node
+
+    # X | Y -> Union[X, Y]
+    @register_rewrite("types", "UnionType")
+    def rewrite_types_UnionType(self, node: TypeNode, /, meta: AMI = AMIS) -> TypeNode:
+        return self.rewrite_typing_Union(TypeNode.intern(self.NP_UNION, node.args))
+
+
+if __name__ == "__main__":
+    ann = typing.Union[typing.List[typing.Dict[str, typing.Tuple[int, ...]]], None]  # noqa: UP006
+    node = TypeNode.from_annotation(ann)
+    print(node)
+    otr = OptionalTreeRewriter()
+    print(otr.rewrite_annotation(ann))
+    print(otr.rewrite_annotation(dict[str, int | None]))
+    print(f"memo size: {otr.memo_size}")